@@ -0,0 +1,145 @@
+# 5S_batch.py
+# Headless batch analysis of candidate ships for the 5S project
+# Reads candidate ships in sss and rle format (as accepted by 5S_update.py)
+# from files or standard input and analyses them (sss.analyseShip) on a pool
+# of worker processes using the isosim simulator. The analysed ships are
+# written in sss format (minimum population, rule, displacement, period and
+# the rle of the minimum population phase) in the same order as the input,
+# as soon as they are available. Runs from the command line without Golly.
+#
+# With --sort the analysed ships are written sorted by speed (period, then
+# decreasing dx and dy) instead, with an external merge sort (see sssio.py)
+# so that memory use is bounded for large files of candidates.
+#
+# With --triage, candidates in sss format are only analysed if their claimed
+# minimum population and speed could be a new speed or an improvement on the
+# 5S collection (see sssdb.needsTest), other candidates are skipped.
+#
+# With --profile FILE the time spent in each phase of the analysis (see
+# sssprof.py) is collected from the workers and written to FILE as JSON (or
+# CSV if FILE ends with .csv).
+#
+# The output can be imported into the collection with 5S_update.py (set
+# importFile).
+#
+# Usage:
+#   python 5S_batch.py candidates.txt [more.txt ...] [-w 8] [-o analysed.sss.txt]
+#   python 5S_batch.py < candidates.txt
+
+from __future__ import division, print_function
+
+import argparse
+import functools
+import multiprocessing
+import sys
+import tempfile
+import timeit
+import isosim
+import sss
+import sssdb
+import sssio
+import sssjournal
+import sssprof
+
+timer = timeit.default_timer
+
+# 5S Project parameters
+MAXGEN = 20000
+
+# Lines of all the input files ('-' for standard input)
+def readLines(fileNames):
+    for fileName in fileNames:
+        if fileName == '-':
+            for line in sys.stdin:
+                yield line
+        else:
+            with open(fileName) as fIn:
+                for line in fIn:
+                    yield line
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description='Headless parallel analysis of candidate ships')
+    parser.add_argument('files', nargs='*', default=['-'],
+                        help='files with candidate ships in sss or rle format (default: stdin)')
+    parser.add_argument('-o', '--output', default='-', help='output file (default: stdout)')
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--max-gen', type=int, default=MAXGEN,
+                        help='maximum number of generations to test each ship for')
+    parser.add_argument('--chunksize', type=int, default=16,
+                        help='number of ships sent to a worker at a time')
+    parser.add_argument('--triage', action='store_true',
+                        help='skip candidates whose claimed minpop does not beat the 5S collection')
+    parser.add_argument('--store', default=sssdb.storeFile,
+                        help='5S collection store (updated from the 5S sss files when they change)')
+    parser.add_argument('--update', type=float, default=10, help='status update interval (s)')
+    parser.add_argument('--sort', action='store_true',
+                        help='write the ships sorted by speed instead of in input order')
+    parser.add_argument('--profile', default=None,
+                        help='write a profile of the analysis to this file (JSON, or CSV for .csv)')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('Number of workers must be at least 1.')
+    return args
+
+def main(argv):
+    args = parseArgs(argv)
+    candidates = sss.parseCandidates(readLines(args.files),
+                                     lambda msg: print(msg, file=sys.stderr))
+    if args.triage:
+        with sssdb.ShipStore(args.store) as store:
+            for collection, shipFile in sssdb.collectionFiles.items():
+                if not sssjournal.syncCollection(store, collection, shipFile):
+                    sys.exit('Failed to load 5S collection into store: %s' % args.store)
+            speedIndex = store.speedIndex()
+        candidates = (newship for newship in candidates
+                      if sssdb.needsTest(speedIndex, newship))
+    analyse = functools.partial(sss.analyseShip, maxgen=args.max_gen)
+    profile = {}
+    if args.profile:
+        analyse = sssprof.Collector(analyse)
+    pool = multiprocessing.Pool(args.workers, isosim.initWorker)
+    fOut = sys.stdout if args.output == '-' else open(args.output, 'w')
+    # Ships in input order (a temporary file when sorting)
+    fShips = tempfile.TemporaryFile(mode='w+') if args.sort else fOut
+    Ntested = Nships = 0
+    start_time = last_time = timer()
+    try:
+        for analysed in pool.imap(analyse, candidates, args.chunksize):
+            if args.profile:
+                analysed, counters = analysed
+                sssprof.merge(profile, counters)
+            ship, msg = analysed
+            Ntested += 1
+            if msg:
+                print(msg, file=sys.stderr)
+            if ship:
+                Nships += 1
+                fShips.write(sssio.formatShip(ship)+'\n')
+            curr_time = timer()
+            if curr_time - last_time >= args.update:
+                print('%d ships analysed of %d candidates (%d candidates/second)' % \
+                      (Nships, Ntested, Ntested / (curr_time - start_time)), file=sys.stderr)
+                last_time = curr_time
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+    finally:
+        pool.join()
+        if args.sort:
+            fShips.seek(0)
+            sssio.writeShips(fOut, sssio.sortShips(sssio.readShips(fShips)))
+            fShips.close()
+        if fOut is not sys.stdout:
+            fOut.close()
+    duration = timer() - start_time
+    print('%d ships analysed of %d candidates in %g s (%d candidates/second).' % \
+          (Nships, Ntested, duration, Ntested / max(duration, 1e-9)), file=sys.stderr)
+    if args.profile:
+        sssprof.writeReport(args.profile, profile,
+                            info=dict(script='5S_batch.py', files=' '.join(args.files),
+                                      workers=args.workers, maxgen=args.max_gen,
+                                      candidates=Ntested, ships=Nships, seconds=duration))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,142 @@
+# benchmark-rle.py
+# Compare the sssrle RLE codec with the original giveRLE implementation
+# Every ship in the given sss files (default: the 5S collection files in the
+# current directory) is decoded and re-encoded with both implementations. The
+# results are checked to be identical and the time taken by each is reported.
+# Runs from the command line, Golly is not needed.
+#
+# Usage:
+#   python benchmark-rle.py ['Orthogonal ships.sss.txt' ...] [-r repeats]
+
+from __future__ import division, print_function
+
+import argparse
+import sys
+import timeit
+import sss
+import sssrle
+
+shipFiles5S = ['Orthogonal ships.sss.txt', 'Diagonal ships.sss.txt', 'Oblique ships.sss.txt']
+
+# Original giveRLE from sss.py (Nathaniel Johnston, DMG, AJP), for reference
+def legacyGiveRLE(clist):
+    clist_chunks = list(sss.chunks(clist, 2))
+    clist_chunks.sort(key=lambda l:(l[1], l[0]))
+    mcc = min(clist_chunks)
+    rl_list = [[x[0]-mcc[0],x[1]-mcc[1]] for x in clist_chunks]
+    rle_res = ""
+    rle_len = 1
+    rl_y = rl_list[0][1] - 1
+    rl_x = 0
+    for rl_i in rl_list:
+        if rl_i[1] == rl_y:
+            if rl_i[0] == rl_x + 1:
+                rle_len += 1
+            else:
+                if rle_len == 1: rle_strA = ""
+                else: rle_strA = str (rle_len)
+                if rl_i[0] - rl_x - 1 == 1: rle_strB = ""
+                else: rle_strB = str (rl_i[0] - rl_x - 1)
+                rle_res = rle_res + rle_strA + "o" + rle_strB + "b"
+                rle_len = 1
+        else:
+            if rle_len == 1: rle_strA = ""
+            else: rle_strA = str (rle_len)
+            if rl_i[1] - rl_y == 1: rle_strB = ""
+            else: rle_strB = str (rl_i[1] - rl_y)
+            if rl_i[0] == 1: rle_strC = "b"
+            elif rl_i[0] == 0: rle_strC = ""
+            else: rle_strC = str (rl_i[0]) + "b"
+            rle_res = rle_res + rle_strA + "o" + rle_strB + "$" + rle_strC
+            rle_len = 1
+        rl_x = rl_i[0]
+        rl_y = rl_i[1]
+    if rle_len == 1: rle_strA = ""
+    else: rle_strA = str (rle_len)
+    rle_res = rle_res[2:] + rle_strA + "o"
+    return rle_res+"!"
+
+# Original character by character RLE parser (from isosim.Headless.parse)
+def legacyParse(rle):
+    clist = []
+    x = y = 0
+    count = ''
+    for ch in rle:
+        if ch.isdigit():
+            count += ch
+            continue
+        n = int(count) if count else 1
+        count = ''
+        if ch in 'b.':
+            x += n
+        elif ch == '$':
+            x = 0
+            y += n
+        elif ch == '!':
+            break
+        elif ch.isalpha():
+            for _ in range(n):
+                clist += [x, y]
+                x += 1
+    return clist
+
+def loadShips(fileNames):
+    rles = []
+    for fileName in fileNames:
+        try:
+            with open(fileName) as f:
+                for line in f:
+                    ship = sss.parseshipstr(line)
+                    if ship:
+                        rles.append(ship[5])
+        except IOError:
+            print('Skipping missing file: %s' % fileName, file=sys.stderr)
+    return rles
+
+# Best time of several repeats of func applied to every item
+def bench(func, items, repeats):
+    def run():
+        for item in items:
+            func(item)
+    return min(timeit.repeat(run, number=1, repeat=repeats))
+
+def report(name, items, tOld, tNew):
+    print('%-10s %8d patterns  original: %8.3f s  sssrle: %8.3f s  speedup: %5.1fx' % \
+          (name, len(items), tOld, tNew, tOld / tNew))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='RLE codec benchmark')
+    parser.add_argument('files', nargs='*', default=shipFiles5S, help='sss format ship files')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='number of timing repeats')
+    args = parser.parse_args(argv)
+
+    rles = loadShips(args.files)
+    if not rles:
+        sys.exit('No ships found.')
+    # Ships paired with their decoded cell lists, skipping empty patterns
+    pairs = [(rle, clist) for rle, clist in ((rle, sssrle.decode(rle)) for rle in rles) if clist]
+    rles = [rle for rle, clist in pairs]
+    clists = [clist for rle, clist in pairs]
+
+    Nmismatch = 0
+    for rle, clist in pairs:
+        if legacyParse(rle) != clist:
+            print('Decode mismatch: %s' % rle)
+            Nmismatch += 1
+        if legacyGiveRLE(clist) != sssrle.encode(clist):
+            print('Encode mismatch: %s' % rle)
+            Nmismatch += 1
+    if Nmismatch:
+        sys.exit('%d mismatches found.' % Nmismatch)
+
+    report('decode', rles, bench(legacyParse, rles, args.repeats),
+           bench(sssrle.decode, rles, args.repeats))
+    report('encode', clists, bench(legacyGiveRLE, clists, args.repeats),
+           bench(sssrle.encode, clists, args.repeats))
+    if sssrle.np is not None:
+        arrays = [sssrle.np.array(clist).reshape(-1, 2) for clist in clists]
+        report('encode[np]', arrays, bench(legacyGiveRLE, clists, args.repeats),
+               bench(sssrle.encode, arrays, args.repeats))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,301 @@
+# benchmark-sss.py
+# Benchmarks of the sss.py primitives and of the search and update pipelines
+# Every benchmark runs on a fixed corpus, so that results can be compared
+# between runs and between versions of the scripts:
+#   - ships: a fixed set of known ships of varying period (knownShips), or the
+#     ships in the given sss files (e.g. a snapshot of the 5S collection)
+#   - candidates: the same ships rotated by 90 degrees, imported into a
+#     collection store holding every other ship (as 5S_update.py does)
+#   - rules: a slice of the pseudo random rule iterator (fixed seed) over the
+#     rules where the glider matches its evolution for one generation
+# For each benchmark the best rate (operations/second) over several repeats
+# and the peak memory allocated by one run (tracemalloc, not available on
+# Python 2) are reported, along with a check value which changes if the
+# results of the benchmarked code change. Results are saved as JSON with a
+# hash of the corpus and a description of the environment, and can be
+# compared with a previous results file (--compare).
+# Runs from the command line with the isosim simulator, Golly is not needed.
+#
+# Usage:
+#   python benchmark-sss.py [-o benchmark.json] [--ships 'Orthogonal ships.sss.txt' ...]
+#                           [-n 1000] [-r 3] [-k testShip -k search] [--compare old.json]
+
+from __future__ import division, print_function
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import isosim
+import matchpatt
+import sss
+import sssdb
+import sssjournal
+import sssrle
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+timer = timeit.default_timer
+
+# Journal size at which the import benchmark compacts a collection's journal
+# (as compactSize in 5S_update.py)
+compactSize = 100
+
+# Known ships in canonical form (sss.canon5Sship), periods 3 to 30
+knownShips = [
+    '5, B3ainj/S2ea3njr, 1, 1, 4, o$b2o$2o!',
+    '9, B3aij/S2eik3ainjr, 2, 0, 4, b4o$o3bo$4bo$o2bo!',
+    '11, B3aij/S2eik3ainjr, 2, 0, 4, 2bo$o3bo$5bo$o4bo$b5o!',
+    '13, B3aij/S2eik3ainjr, 2, 0, 4, 2b2o$o4bo$6bo$o5bo$b6o!',
+    '3, B2ik3airy/S03ai, 1, 0, 3, o$2bo$o!',
+    '5, B2cin3a4q/S02a4w, 1, 1, 3, 2bo$3bo$o$bobo!',
+    '4, B2cn3-ceqr4t/S02c3ei4e, 1, 0, 5, bo2$o2bo2$bo!',
+    '6, B2k3aijr4a6e/S02ean3ar5an6cen, 1, 1, 5, obo$2bo$3o!',
+    '5, B3aij4a5y/S2ea3anjr4ak, 2, 0, 6, 2o$b2o$o!',
+    '5, B2ckn3eai/S02e3cajr4arw5c, 1, 1, 7, 3o$o$o!',
+    '8, B2c3ainj4anr5ar/S2cai3nr4ar5ij7c, 1, 0, 8, obo$2b2o$2b2o$obo!',
+    '5, B2i3-ck4rt5ei/S2a3eny4irt, 1, 0, 9, obo$o$obo!',
+    '5, B2ck3ainjy4aiw/S02ea3enjqr4k5njq, 1, 1, 11, 2bo$3o$bo!',
+    '4, B2c3-cekq4akj/S02e3injqr, 2, 0, 12, bo2$obo$o!',
+    '5, B2c3ain5cr/S2eak3cenjq4j6k, 2, 2, 12, o$bo$3o!',
+    '5, B2c3eainr4w5a/S2ea3cnr4knt5j, 2, 0, 14, b2o$2bo$obo!',
+    '3, B2k3ainj4aqr/S02e3injr4kj5q, 1, 1, 16, 2bo$o$3bo!',
+    '5, B2ck3eain4ea/S02eak3ein4akjqyz6k, 2, 2, 18, bobo$ob2o!',
+    '6, B3ainjr4antw5jq/S2ea3enjr4ik5iknjy6a, 2, 0, 20, 2o$3o$o!',
+    '5, B2ck3ain4ir5c6n8/S2-n3njr4aiky5aiqry6ak, 2, 0, 24, 3o$o$bo!',
+    '4, B3eainj4y5k/S02ea3-ciqy4jrw5air6a, 2, 0, 28, bo$2o2$bo!',
+    '4, B2ik3-cjqr4erz5ceir6k/S2cea3-cai4einrt5ciknr6k, 1, 0, 30, o$2o$o!',
+]
+
+# Pattern, rule and number of generations defining the rule space slice
+searchPattern = ('bo$2bo$3o!', 'B3/S23', 1)
+searchSeed = 1
+
+benchmarkNames = ['giveRLE', 'parseshipstr', 'testShip', 'canon5Sship', 'getRuleRangeElems',
+                  'iterRuleStr', 'import5S', 'search', 'searchBatch']
+
+def loadShips(fileNames):
+    ships = []
+    for fileName in fileNames:
+        with open(fileName) as f:
+            ships += [line.strip() for line in f if sss.parseshipstr(line)]
+    return ships
+
+# Candidate for import: ship rotated by 90 degrees, in rle format (as found by
+# a search script, so that it has to be analysed and canonised)
+def rotatedCandidate(ship):
+    clist = sssrle.decode(ship[5])
+    rotated = [c for x, y in zip(clist[0::2], clist[1::2]) for c in (-y, x)]
+    return 'x = 0, y = 0, rule = %s\n%s' % (ship[1], sss.giveRLE(rotated))
+
+# Import candidates into a collection store as 5S_update.py does: analyse each
+# candidate, update the store (sssdb.updateStore) and record the new and
+# updated ships in the collections' journals (sssjournal.recordShips), with
+# the collection files in exportDir. Returns the number of ships recorded.
+def importShips(store, candidates, exportDir):
+    newShips = []
+    newPhases = []
+    for newship in sss.parseCandidates(candidates):
+        cycle = []
+        ship, msg = sss.analyseShip(newship, phases=cycle)
+        if ship:
+            newShips.append(ship)
+            newPhases.append(cycle)
+    newSpeeds, updateSpeeds = sssdb.updateStore(store, newShips, phases=newPhases)
+    Nrecords = 0
+    for collection in sssdb.collectionNames:
+        ships = [store.get(speed) for speed in newSpeeds[collection] + updateSpeeds[collection]]
+        if ships:
+            sssFile = os.path.join(exportDir, '%s.sss.txt' % collection)
+            sssjournal.recordShips(store, collection, sssFile, ships, compactSize)
+            Nrecords += len(ships)
+    store.commit()
+    return Nrecords
+
+# Best time of several repeats of run(setup()) and peak memory allocated by
+# one run. Returns the benchmark results and the check value returned by run.
+def bench(run, Nops, repeats, setup=lambda: None):
+    best = None
+    for _ in range(repeats):
+        state = setup()
+        start = timer()
+        check = run(state)
+        seconds = timer() - start
+        best = seconds if best is None else min(best, seconds)
+    peak = None
+    if tracemalloc:
+        state = setup()
+        tracemalloc.start()
+        run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return dict(ops=Nops, seconds=best, opsPerSec=Nops / max(best, 1e-9), peakBytes=peak,
+                check=check)
+
+def checkHash(values):
+    return hashlib.sha1(repr(values).encode()).hexdigest()[:16]
+
+def runBenchmarks(args, shipLines, tmpDir):
+    g = isosim.Headless()
+    sss.setBackend(g)
+    ships = [sss.parseshipstr(line) for line in shipLines]
+    clists = [sssrle.decode(ship[5]) for ship in ships]
+    results = {}
+
+    def placeShip(ship):
+        g.new('')
+        g.setrule(ship[1])
+        g.putcells(g.parse(ship[5]))
+
+    def benchGiveRLE(state):
+        return checkHash([sss.giveRLE(clist) for clist in clists])
+
+    def benchParse(state):
+        return checkHash([sss.parseshipstr(line) for line in shipLines])
+
+    def benchTestShip(state):
+        return checkHash([sss.testShip(ship[5], ship[1])[0:2] for ship in ships])
+
+    def benchCanon(state):
+        return checkHash([sss.canon5Sship(ship) for ship in ships])
+
+    def benchRuleRange(state):
+        ranges = []
+        for ship in ships:
+            placeShip(ship)
+            ranges.append(sss.getRuleRangeElems(ship[4]))
+        return checkHash(ranges)
+
+    # Rule space slice
+    rle, rulestr, numgen = searchPattern
+    g.new('')
+    g.setrule(rulestr)
+    g.putcells(g.parse(rle))
+    origPatt = g.getcells(g.getrect())
+    B_need, S_need, B_OK, S_OK = sss.getRuleRangeElems(numgen)
+    B_OK = [t for t in B_OK if t not in B_need]
+    S_OK = [t for t in S_OK if t not in S_need]
+    stabGen = 5 * numgen
+
+    def benchIterRule(state):
+        rules = sss.iterRuleStr(B_OK, S_OK, B_need, S_need, seed=searchSeed)
+        return checkHash([next(rules) for _ in range(args.rules)])
+
+    def benchSearch(batchSize):
+        def run(state):
+            matchpatt.resetStats()
+            rules = sss.iterRule(B_OK, S_OK, B_need, S_need, seed=searchSeed).slice(0, args.rules, 1)
+            found = [result for result in
+                     matchpatt.iterResults(rules, origPatt, stabGen, batchSize) if result]
+            return checkHash(sorted(found))
+        return run
+
+    # Collection snapshot (every other ship) and candidates
+    storeFile = os.path.join(tmpDir, 'store.sqlite')
+    collection = dict((c, os.path.join(tmpDir, '%s.snapshot.txt' % c)) for c in sssdb.collectionNames)
+    files = dict((c, open(fileName, 'w')) for c, fileName in collection.items())
+    for ship in ships[0::2]:
+        dy, dx = sss.minmaxofabs(ship[2:4])
+        files[sssdb.shipType(dx, dy) or 'o'].write(', '.join(map(str, ship)) + '\n')
+    for f in files.values():
+        f.close()
+    candidates = '\n'.join(rotatedCandidate(ship) for ship in ships).splitlines()
+
+    importDir = os.path.join(tmpDir, 'import')
+    os.mkdir(importDir)
+
+    # Fresh store and collection files (the snapshot, without a journal)
+    def importSetup():
+        if os.path.exists(storeFile):
+            os.remove(storeFile)
+        store = sssdb.ShipStore(storeFile)
+        for c, fileName in collection.items():
+            sssFile = os.path.join(importDir, '%s.sss.txt' % c)
+            shutil.copyfile(fileName, sssFile)
+            if os.path.exists(sssjournal.journalName(sssFile)):
+                os.remove(sssjournal.journalName(sssFile))
+            store.sync(c, sssFile)
+        return store
+
+    def benchImport(store):
+        Nrecords = importShips(store, candidates, importDir)
+        store.close()
+        return Nrecords
+
+    benchmarks = {
+        'giveRLE': (benchGiveRLE, len(clists), None),
+        'parseshipstr': (benchParse, len(shipLines), None),
+        'testShip': (benchTestShip, len(ships), None),
+        'canon5Sship': (benchCanon, len(ships), None),
+        'getRuleRangeElems': (benchRuleRange, len(ships), None),
+        'iterRuleStr': (benchIterRule, args.rules, None),
+        'import5S': (benchImport, len(ships), importSetup),
+        'search': (benchSearch(1), args.rules, None),
+        'searchBatch': (benchSearch(args.batch), args.rules, None),
+    }
+    for name in args.benchmarks or benchmarkNames:
+        run, Nops, setup = benchmarks[name]
+        results[name] = bench(run, Nops, args.repeats, setup or (lambda: None))
+        report(name, results[name])
+    return results
+
+def report(name, result, old=None):
+    peak = '%10.1f KiB' % (result['peakBytes'] / 1024) if result['peakBytes'] is not None else '%14s' % '-'
+    msg = '%-18s %8d ops %10.1f ops/s %s' % (name, result['ops'], result['opsPerSec'], peak)
+    if old:
+        msg += '  %5.2fx' % (result['opsPerSec'] / old['opsPerSec'])
+        if old['check'] != result['check']:
+            msg += '  (results differ)'
+    print(msg)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmarks of sss.py and the search and update pipelines')
+    parser.add_argument('-o', '--output', default='benchmark-sss.json', help='results file (JSON)')
+    parser.add_argument('--ships', nargs='*', default=None,
+                        help='sss files with the ships to use (default: built in known ships)')
+    parser.add_argument('-n', '--rules', type=int, default=1000,
+                        help='number of rules in the rule space slice')
+    parser.add_argument('-b', '--batch', type=int, default=64, help='batch size for searchBatch')
+    parser.add_argument('-r', '--repeats', type=int, default=3, help='number of timing repeats')
+    parser.add_argument('-k', '--benchmark', dest='benchmarks', action='append',
+                        choices=benchmarkNames, help='benchmark to run (default: all)')
+    parser.add_argument('--compare', default=None, help='previous results file to compare with')
+    args = parser.parse_args(argv)
+
+    shipLines = loadShips(args.ships) if args.ships else knownShips
+    if not shipLines:
+        sys.exit('No ships found.')
+    corpus = dict(ships=len(shipLines), shipsHash=checkHash(shipLines),
+                  shipFiles=args.ships or [], rules=args.rules, seed=searchSeed,
+                  searchPattern=list(searchPattern))
+    tmpDir = tempfile.mkdtemp()
+    try:
+        results = runBenchmarks(args, shipLines, tmpDir)
+    finally:
+        shutil.rmtree(tmpDir)
+    info = dict(date=time.strftime('%Y-%m-%d %H:%M:%S'), python=platform.python_version(),
+                platform=platform.platform(), numpy=isosim.np.__version__,
+                repeats=args.repeats, batch=args.batch)
+    with open(args.output, 'w') as f:
+        json.dump(dict(info=info, corpus=corpus, benchmarks=results), f, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if old['corpus'] != corpus:
+            print('Warning: corpus differs from %s' % args.compare, file=sys.stderr)
+        print('Compared with %s (%s):' % (args.compare, old['info']['date']))
+        for name in benchmarkNames:
+            if name in results:
+                report(name, results[name], old['benchmarks'].get(name))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
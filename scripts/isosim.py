@@ -0,0 +1,462 @@
+# isosim.py
+# Headless simulator for isotropic 2-state rules on the Moore neighbourhood
+# Rules are compiled to a 512 entry lookup table indexed by the encoded 3x3
+# neighbourhood of each cell (see sss.HenselNbhd). The neighbourhood codes for
+# the whole grid are built with vectorized shifts of a NumPy array, so one
+# generation costs a handful of array operations.
+#
+# The Headless class provides the subset of the Golly scripting API used by
+# sss.py and the search scripts, so those routines can be run without Golly:
+#   import sss, isosim
+#   sss.setBackend(isosim.Headless())
+#   minpop, speed, _ = sss.testShip('bo$2bo$3o!', 'B3/S23')
+# Rules can also be set from an sss.IsoRule with g.setisorule() (or
+# sss.setrule()), which avoids creating and parsing a rule string.
+#
+# BatchGrid evolves one pattern in many rules at once (one lookup table per
+# rule applied to a stack of grids), for testing batches of rules in searches.
+#
+# Limitations:
+#   - Rules with B0 are not supported
+#   - Patterns are simulated on an unbounded plane, bounded grid suffixes in
+#     the rule string (e.g. ':T100,100') are ignored
+
+from __future__ import print_function
+
+import signal
+import sys
+import zlib
+import numpy as np
+import sss
+import sssrle
+
+# Offsets of the cells in the neighbourhood, in the bit order of the
+# neighbourhood encoding
+nbhdOffsets = [(i % 3 - 1, i // 3 - 1) for i in range(9)]
+
+# Parse an isotropic rule string
+# Raises RuntimeError (like g.setrule) if the rule is not a valid isotropic
+# 2-state rule, or contains B0
+def parseRule(rulestr):
+    try:
+        rule = sss.IsoRule.fromString(rulestr)
+    except ValueError:
+        raise RuntimeError('Given rule is not valid: %s' % rulestr)
+    if rule.b & 1:
+        raise RuntimeError('B0 rules are not supported: %s' % rulestr)
+    return rule
+
+# Transition index and centre cell state of each encoded neighbourhood
+nbhdTransIdx = np.array([sss.transIndex[t] for t in sss.nbhdTrans], dtype=np.uint64)
+nbhdCentre = (np.arange(512) & 16) > 0
+
+# Compile a rule (IsoRule) to a neighbourhood lookup table
+def ruleTable(rule):
+    masks = np.where(nbhdCentre, np.uint64(rule.s), np.uint64(rule.b))
+    return ((masks >> nbhdTransIdx) & np.uint64(1)).astype(np.uint8)
+
+# Transitions exercised by a set of encoded neighbourhoods
+# used is a boolean array of 512 entries (indexed by neighbourhood code),
+# returns the birth and survival transition bitmasks (as IsoRule.b and s).
+nbhdTransBit = [1 << int(i) for i in nbhdTransIdx]
+def usedMasks(used):
+    b = s = 0
+    for code in np.flatnonzero(used).tolist():
+        if code & 16:
+            s |= nbhdTransBit[code]
+        else:
+            b |= nbhdTransBit[code]
+    return b, s
+
+# Encoded neighbourhood of every cell in a 2D array of cell states (or a
+# stack of 2D arrays, the last two axes are the rows and columns)
+# The result is two cells larger than the input in each direction so that it
+# covers every cell which can be born in the next generation.
+def nbhdCodes(cells):
+    h, w = cells.shape[-2:]
+    padded = np.zeros(cells.shape[:-2] + (h+4, w+4), dtype=np.uint16)
+    padded[..., 2:h+2, 2:w+2] = cells
+    codes = np.zeros(cells.shape[:-2] + (h+2, w+2), dtype=np.uint16)
+    for bit, (dx, dy) in enumerate(nbhdOffsets):
+        codes |= padded[..., 1+dy:h+3+dy, 1+dx:w+3+dx] << bit
+    return codes
+
+# Zobrist table for translation invariant pattern hashes
+# Pseudo random 64-bit value for each position relative to the top left
+# corner of the bounding box (a fixed function of the position, so the table
+# can be extended without changing existing values).
+zobristTable = np.zeros((0, 0), dtype=np.uint64)
+
+def zobrist(h, w):
+    global zobristTable
+    if h > zobristTable.shape[0] or w > zobristTable.shape[1]:
+        h2, w2 = max(h, 2*zobristTable.shape[0]), max(w, 2*zobristTable.shape[1])
+        z = np.arange(h2, dtype=np.uint64)[:, None] * np.uint64(0x9E3779B97F4A7C15) + \
+            np.arange(w2, dtype=np.uint64)[None, :] * np.uint64(0xC2B2AE3D27D4EB4F)
+        # splitmix64 finaliser
+        z ^= z >> np.uint64(30)
+        z *= np.uint64(0xBF58476D1CE4E5B9)
+        z ^= z >> np.uint64(27)
+        z *= np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+        zobristTable = z
+    return zobristTable[:h, :w]
+
+# A finite pattern on the unbounded plane
+# Cells are held in a 2D uint8 array (indexed [y, x]) which is cropped to the
+# bounding box of the pattern, with (x0, y0) the position of the top left cell.
+class Grid(object):
+    def __init__(self, clist=()):
+        self.setcells(clist)
+
+    def setcells(self, clist):
+        clist = np.asarray(clist, dtype=np.int64).reshape(-1, 2)
+        if not len(clist):
+            self.cells = np.zeros((0, 0), dtype=np.uint8)
+            self.x0 = self.y0 = 0
+            return
+        self.x0, self.y0 = clist.min(axis=0)
+        w, h = clist.max(axis=0) - (self.x0, self.y0) + 1
+        self.cells = np.zeros((h, w), dtype=np.uint8)
+        self.cells[clist[:, 1] - self.y0, clist[:, 0] - self.x0] = 1
+
+    # Flat cell list [x1, y1, x2, y2, ...] in reading order (like g.getcells)
+    def getcells(self, rect=None):
+        ys, xs = np.nonzero(self.cells)
+        xs = xs + self.x0
+        ys = ys + self.y0
+        if rect:
+            x, y, w, h = rect
+            inside = (xs >= x) & (xs < x+w) & (ys >= y) & (ys < y+h)
+            xs, ys = xs[inside], ys[inside]
+        return np.column_stack((xs, ys)).ravel().tolist()
+
+    def getrect(self):
+        if not self.cells.any():
+            return []
+        h, w = self.cells.shape
+        return [int(self.x0), int(self.y0), w, h]
+
+    def getpop(self):
+        return int(np.count_nonzero(self.cells))
+
+    # Cell states in the given rectangle as a 2D array
+    def getarray(self, rect):
+        x, y, w, h = rect
+        arr = np.zeros((h, w), dtype=np.uint8)
+        ch, cw = self.cells.shape
+        x1, y1 = max(x, self.x0), max(y, self.y0)
+        x2, y2 = min(x+w, self.x0+cw), min(y+h, self.y0+ch)
+        if x1 < x2 and y1 < y2:
+            arr[y1-y:y2-y, x1-x:x2-x] = self.cells[y1-self.y0:y2-self.y0, x1-self.x0:x2-self.x0]
+        return arr
+
+    def empty(self):
+        return not self.cells.any()
+
+    # Translation invariant 64-bit hash of the pattern (as BatchGrid.hashes)
+    def zobristHash(self):
+        return int((self.cells * zobrist(*self.cells.shape)).sum(dtype=np.uint64))
+
+    # Crop the cell array to the bounding box of the pattern
+    def crop(self):
+        rows = np.flatnonzero(self.cells.any(axis=1))
+        if not rows.size:
+            self.cells = np.zeros((0, 0), dtype=np.uint8)
+            return
+        cols = np.flatnonzero(self.cells.any(axis=0))
+        self.cells = self.cells[rows[0]:rows[-1]+1, cols[0]:cols[-1]+1]
+        self.y0 += rows[0]
+        self.x0 += cols[0]
+
+    # Advance the pattern by one generation using a rule lookup table
+    # The neighbourhoods which occur are recorded in used (see usedMasks) if
+    # it is given.
+    def step(self, table, used=None):
+        if not self.cells.size:
+            return
+        codes = nbhdCodes(self.cells)
+        if used is not None:
+            used[codes] = True
+        self.cells = table[codes]
+        self.x0 -= 1
+        self.y0 -= 1
+        self.crop()
+
+    def run(self, table, ngens, used=None):
+        for _ in sss.xrange(ngens):
+            if not self.cells.size:
+                break
+            self.step(table, used)
+
+# A batch of finite patterns, each evolving in its own rule
+# Cells are held in a 3D uint8 array (indexed [k, y, x]) where each pattern is
+# aligned with the top left corner of its bounding box, (x0[k], y0[k]) is the
+# position of that corner and (w[k], h[k]) the size of the bounding box. The
+# array is as large as the largest bounding box, so all the patterns are
+# stepped together by a few array operations using a stack of rule lookup
+# tables (one row per pattern). Patterns can be removed from the batch with
+# select() when they have been resolved. With track set, the transitions
+# exercised by each pattern are recorded (see usedMasks).
+class BatchGrid(object):
+    def __init__(self, clist, tables, track=False):
+        grid = Grid(clist)
+        self.tables = np.array(tables, dtype=np.uint8).reshape(-1, 512)
+        K = len(self.tables)
+        self.cells = np.repeat(grid.cells[None], K, axis=0)
+        h, w = grid.cells.shape
+        self.x0 = np.full(K, grid.x0, dtype=np.int64)
+        self.y0 = np.full(K, grid.y0, dtype=np.int64)
+        self.h = np.full(K, h, dtype=np.int64)
+        self.w = np.full(K, w, dtype=np.int64)
+        self.used = np.zeros((K, 512), dtype=bool) if track else None
+
+    def __len__(self):
+        return len(self.tables)
+
+    # Advance all patterns by one generation
+    def step(self):
+        K = len(self.tables)
+        if not self.cells.size:
+            return
+        codes = nbhdCodes(self.cells).astype(np.intp)
+        codes += (np.arange(K, dtype=np.intp) * 512)[:, None, None]
+        if self.used is not None:
+            self.used.ravel()[codes] = True
+        self.x0 -= 1
+        self.y0 -= 1
+        self.align(self.tables.ravel()[codes])
+
+    def run(self, ngens):
+        for _ in sss.xrange(ngens):
+            self.step()
+
+    # Align each pattern with the top left corner of its bounding box
+    def align(self, cells):
+        K, H, W = cells.shape
+        rows = cells.any(axis=2)
+        cols = cells.any(axis=1)
+        alive = rows.any(axis=1)
+        top = rows.argmax(axis=1)
+        left = cols.argmax(axis=1)
+        self.h = np.where(alive, H - rows[:, ::-1].argmax(axis=1) - top, 0)
+        self.w = np.where(alive, W - cols[:, ::-1].argmax(axis=1) - left, 0)
+        self.x0 += left
+        self.y0 += top
+        Hn = int(self.h.max()) if K else 0
+        Wn = int(self.w.max()) if K else 0
+        # Copy the patterns with the same offset together (the offsets are
+        # nearly always small, so there are only a few groups). Cells beyond a
+        # pattern's bounding box are dead, so each pattern can be copied with
+        # the full size of the new array.
+        aligned = np.zeros((K, Hn, Wn), dtype=np.uint8)
+        offsets = top * W + left
+        for offset in np.unique(offsets[alive]).tolist():
+            sel = np.flatnonzero(offsets == offset)
+            y, x = divmod(offset, W)
+            h, w = min(Hn, H - y), min(Wn, W - x)
+            aligned[sel, :h, :w] = cells[sel, y:y+h, x:x+w]
+        self.cells = aligned
+
+    # Keep the patterns selected by an index array or boolean mask
+    def select(self, idx):
+        for attr in ('tables', 'x0', 'y0', 'h', 'w'):
+            setattr(self, attr, getattr(self, attr)[idx])
+        if self.used is not None:
+            self.used = self.used[idx]
+        Hn = int(self.h.max()) if len(self.h) else 0
+        Wn = int(self.w.max()) if len(self.w) else 0
+        self.cells = self.cells[idx, :Hn, :Wn]
+
+    # Bounding boxes of the patterns as [x, y, w, h] (like g.getrect)
+    def rects(self):
+        return np.column_stack((self.x0, self.y0, self.w, self.h)).tolist()
+
+    def pops(self):
+        return np.count_nonzero(self.cells.reshape(len(self.cells), -1), axis=1)
+
+    # Translation invariant 64-bit hash of each pattern
+    def hashes(self):
+        K, H, W = self.cells.shape
+        return (self.cells * zobrist(H, W)).reshape(K, -1).sum(axis=1, dtype=np.uint64)
+
+    # Transitions exercised by pattern k (birth and survival bitmasks)
+    def usedMasks(self, k):
+        return usedMasks(self.used[k])
+
+    # Cell states in the bounding box of pattern k
+    def getarray(self, k):
+        return self.cells[k, :self.h[k], :self.w[k]]
+
+    # Flat cell list of pattern k (like g.getcells)
+    def getcells(self, k):
+        ys, xs = np.nonzero(self.getarray(k))
+        return np.column_stack((xs + self.x0[k], ys + self.y0[k])).ravel().tolist()
+
+# Golly compatible headless backend
+# Supports the scripting commands used by sss.py and the search scripts. The
+# layer holds a single Grid, user interface commands are no-ops (g.show and
+# g.note write to stderr when verbose is set).
+class Headless(object):
+    def __init__(self, rule='B3/S23', verbose=False):
+        self.verbose = verbose
+        self.grid = Grid()
+        self.gen = 0
+        self.selrect = []
+        self.tables = {}
+        self.used = None
+        self.setrule(rule)
+
+    # Pattern commands
+    def new(self, title=''):
+        self.grid = Grid()
+        self.gen = 0
+        self.selrect = []
+
+    def empty(self):
+        return self.grid.empty()
+
+    def getrect(self):
+        return self.grid.getrect()
+
+    def getpop(self):
+        return str(self.grid.getpop())
+
+    def getcells(self, rect):
+        if not rect:
+            return []
+        return self.grid.getcells(rect)
+
+    # 32-bit hash of the pattern in rect, which depends on the positions of
+    # the live cells relative to the rectangle (like g.hash)
+    def hash(self, rect):
+        if rect == self.grid.getrect():
+            arr = self.grid.cells
+        else:
+            arr = self.grid.getarray(rect)
+        return zlib.crc32(np.ascontiguousarray(arr).tobytes(), zlib.crc32(str(arr.shape).encode()))
+
+    def putcells(self, clist, x0=0, y0=0, axx=1, axy=0, ayx=0, ayy=1, mode='or'):
+        if not clist:
+            return
+        clist = self.transform(clist, x0, y0, axx, axy, ayx, ayy)
+        if mode == 'copy' or mode == 'or':
+            self.grid.setcells(self.grid.getcells() + list(clist))
+        else:
+            raise RuntimeError('Unsupported putcells mode: %s' % mode)
+
+    def select(self, rect):
+        self.selrect = list(rect)
+
+    def getselrect(self):
+        return list(self.selrect)
+
+    # Clear inside (where = 0) or outside (where = 1) the selection
+    def clear(self, where):
+        if not self.selrect:
+            return
+        inside = self.grid.getcells(self.selrect)
+        if where:
+            self.grid.setcells(inside)
+        else:
+            inside = set(zip(inside[::2], inside[1::2]))
+            clist = self.grid.getcells()
+            self.grid.setcells([c for xy in zip(clist[::2], clist[1::2])
+                                if xy not in inside for c in xy])
+
+    def run(self, ngens):
+        self.grid.run(self.table, ngens, self.used)
+        self.gen += ngens
+
+    # Transition usage tracking (not in the Golly API)
+    # trackTransitions() starts recording the transitions exercised by the
+    # pattern from now on (or stops recording if bTrack is False),
+    # usedTransitions() returns the birth and survival bitmasks of the
+    # transitions exercised since then.
+    def trackTransitions(self, bTrack=True):
+        self.used = np.zeros(512, dtype=bool) if bTrack else None
+
+    def usedTransitions(self):
+        return usedMasks(self.used)
+
+    def step(self):
+        self.run(1)
+
+    def getgen(self):
+        return str(self.gen)
+
+    def setgen(self, gen):
+        self.gen = int(gen)
+
+    # Rule commands
+    # Lookup tables for rule strings are cached (a search sets the same few
+    # rules many times), IsoRule objects are compiled directly.
+    maxTables = 256
+
+    def setrule(self, rulestr):
+        if rulestr not in self.tables:
+            if len(self.tables) >= self.maxTables:
+                self.tables.clear()
+            rule = parseRule(rulestr)
+            self.tables[rulestr] = (rule, ruleTable(rule))
+        self.rule, self.table = self.tables[rulestr]
+
+    def setisorule(self, rule):
+        if rule.b & 1:
+            raise RuntimeError('B0 rules are not supported: %s' % rule)
+        self.rule, self.table = rule, ruleTable(rule)
+
+    def getrule(self):
+        return str(self.rule)
+
+    def numstates(self):
+        return 2
+
+    # Cell list commands
+    # Any live state is treated as state 1
+    def parse(self, rle, x0=0, y0=0, axx=1, axy=0, ayx=0, ayy=1):
+        clist = sssrle.decode(rle)
+        if (x0, y0, axx, axy, ayx, ayy) == (0, 0, 1, 0, 0, 1):
+            return clist
+        return self.transform(clist, x0, y0, axx, axy, ayx, ayy)
+
+    def transform(self, clist, x0, y0, axx=1, axy=0, ayx=0, ayy=1):
+        return [c for (x, y) in zip(clist[::2], clist[1::2])
+                for c in (x0 + x*axx + y*axy, y0 + x*ayx + y*ayy)]
+
+    def evolve(self, clist, ngens):
+        grid = Grid(clist)
+        grid.run(self.table, ngens)
+        return grid.getcells()
+
+    # User interface commands
+    def show(self, msg):
+        if self.verbose:
+            print(msg, file=sys.stderr)
+
+    def note(self, msg):
+        print(msg, file=sys.stderr)
+
+    def warn(self, msg):
+        print(msg, file=sys.stderr)
+
+    def exit(self, msg=''):
+        raise SystemExit(msg or None)
+
+    def update(self):
+        pass
+
+    def fit(self):
+        pass
+
+    def setmag(self, mag):
+        pass
+
+    def getevent(self):
+        return ''
+
+# Select the headless backend in a worker process (multiprocessing pool
+# initializer). Handling of Ctrl-C is left to the main process.
+def initWorker(verbose=False):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    sss.setBackend(Headless(verbose=verbose))
@@ -0,0 +1,788 @@
+# matchpatt.py
+# Rule testing routines for the match pattern rule searches
+# Shared by searchRule-matchPatt2.py (run in Golly) and searchRule-parallel.py
+# (run headless with the isosim backend). All routines operate on the current
+# sss backend (see sss.setBackend).
+
+from __future__ import division
+
+import copy
+import itertools
+import json
+import os
+import signal
+import traceback
+import rulecache
+import sss
+import sssdb
+import sssjournal
+import sssprof
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+xrange = sss.xrange
+
+# Search parameters (descriptions in searchRule-matchPatt2.py)
+# Set with setParams() so that dependent parameters are kept consistent
+minShipP = 30
+minSpeed = 0.5
+fastShipP = 9
+minOscP = 3
+maxGen = 20000
+maxPop = 1000
+maxDim = 500
+bOsc = False
+stabCheckP = 24
+growthChecks = 8
+minPop = 3
+searchParams = ('minShipP', 'minSpeed', 'fastShipP', 'minOscP', 'maxGen',
+                'maxPop', 'maxDim', 'bOsc', 'stabCheckP', 'growthChecks', 'minPop')
+
+def setParams(**params):
+    for k, v in params.items():
+        if not k in searchParams:
+            raise KeyError('Unknown search parameter: %s' % k)
+        globals()[k] = v
+    if not 'minPop' in params:
+        # Patterns with 0, or 1 cells can not be oscillators
+        # Patterns with 0, 1, or 2 cells can not be ships
+        globals()['minPop'] = 2 if bOsc else 3
+
+def getParams():
+    return dict((k, globals()[k]) for k in searchParams)
+
+# Rejection statistics
+# Number of rules and generations simulated for each outcome of testRule:
+#   equiv - rule agrees with a rejected rule on all the transitions exercised
+#           by the pattern (not tested, see DecidedRules)
+#   cached - rule was rejected in a previous search (not tested, see
+#            rulecache.py)
+#   stabDied - pattern died during the stabilisation time
+#   stabPop - population out of range after the stabilisation time
+#   pop - population out of range
+#   bbox - bounding box larger than maxDim
+#   growth - bounding box grew in growthChecks consecutive stability checks
+#   lowPeriod - pattern is a low period oscillator or spaceship
+#   maxGen - no periodicity found within maxGen generations
+#   found - interesting oscillator or spaceship
+testStages = ('equiv', 'cached', 'stabDied', 'stabPop', 'pop', 'bbox', 'growth', 'lowPeriod', 'maxGen', 'found')
+testStats = dict((stage, [0, 0]) for stage in testStages)
+
+def countStage(stage, gens, N=1):
+    testStats[stage][0] += N
+    testStats[stage][1] += gens
+
+# Outcome of the last test by testRule, as (stage, cycle) where cycle is the
+# canonical (dx, dy, period) for periodic patterns (stage 'cycle', whether or
+# not the result is interesting) and () otherwise
+lastOutcome = None
+# Record of the cycle of the last interesting result yielded by iterResults
+# or searchTree (see sss.runCycle), starting with the phase the pattern is
+# left in
+lastCycle = None
+
+def endTest(stage, gens, cycle=()):
+    global lastOutcome
+    lastOutcome = ('cycle' if cycle else stage), cycle
+    countStage(stage, gens)
+
+def resetStats():
+    for stage in testStages:
+        testStats[stage] = [0, 0]
+
+# Add statistics from another process to stats
+def mergeStats(stats, other):
+    for stage, (N, gens) in other.items():
+        stats[stage][0] += N
+        stats[stage][1] += gens
+
+def statsReport(stats):
+    return ', '.join('%s: %d (%d gen)' % (stage, stats[stage][0], stats[stage][1])
+                     for stage in testStages if stats[stage][0])
+
+# Classify a periodic pattern with the given displacement and period
+# Returns (dx, dy, period) for interesting results, otherwise an empty tuple.
+def classify(dx, dy, period):
+    if (dx == 0):
+        # Oscillator (reject if low period or bOsc is False)
+        if bOsc and period >= minOscP:
+            return (0, 0, period)
+    elif ( period >= minShipP ):
+        # Spaceship
+        return (dx, dy, period)
+    elif ( (dx + dy/1.9) / (period * 1.0) > minSpeed and period >= fastShipP ):
+        # Fast spaceship
+        return (dx, dy, period)
+    # Pattern is a low period oscillator or spaceship
+    return ()
+
+# Test pattern in given rule
+# Original pattern is evolved in the given randomly generated rule.
+# Pattern is evolved for a short stabilisation period and then tested to
+# determine if it has become an oscillator or a spaceship.
+# The rule is given as a rule string or an sss.IsoRule.
+# Returns (dx, dy, period) for interesting results, otherwise an empty tuple.
+# The pattern is left in a phase of the cycle.
+#
+# Candidates are rejected by a cascade of cheap tests before the full
+# periodicity test (comparison of cell lists), see testStats. Every
+# generation is identified by sss.phaseKey() (population, bounding box size
+# and a translation invariant hash) and the generation where each identity
+# was first seen is recorded, so a cycle is detected the first time any phase
+# repeats, whether or not it contains the starting phase. A repeat of the
+# starting phase is verified by comparing cell lists, a repeat of a later
+# phase by running the cycle once more (sss.runCycle).
+# If phases (a list) is given, it is set to the record of the cycle of an
+# interesting result (see sss.runCycle), starting with the phase the pattern
+# is left in. The record is kept from the verification of a later phase, a
+# repeat of the starting phase is run for one more period to record it.
+@sssprof.profiled('testRule')
+def testRule(rule, origPatt, stabGen, phases=None):
+    g = sss.getBackend()
+    r = g.getrect()
+    if r:
+        g.select(r)
+        g.clear(0)
+    g.putcells(origPatt)
+    sss.setrule(rule)
+    with sssprof.timed('testRule.stabilise'):
+        g.run(stabGen)
+    if g.empty():
+        endTest('stabDied', stabGen)
+        return ()
+    pop = int(g.getpop())
+    if (pop < minPop or pop > maxPop):
+        endTest('stabPop', stabGen)
+        return ()
+    r = g.getrect()
+    testPatt = g.transform(g.getcells(r),-r[0],-r[1])
+    seen = {sss.phaseKey(r): (0, r[0], r[1])}
+    lastDim = max(r[2:4])
+    Ngrowth = 0
+    gen = 0
+    while gen < maxGen:
+        g.run(1)
+        gen += 1
+        pop = int(g.getpop())
+        if (pop < minPop or pop > maxPop):
+            endTest('pop', stabGen+gen)
+            return ()
+        r = g.getrect()
+        # BBox expansion
+        if maxDim > 0 and max(r[2:4]) > maxDim:
+            # XXX Attempt to separate components expanding in different directions
+            endTest('bbox', stabGen+gen)
+            return ()
+        key = sss.phaseKey(r)
+        if key in seen:
+            # Test for periodicity
+            gen0, x0, y0 = seen[key]
+            period = gen - gen0
+            with sssprof.timed('testRule.periodicity'):
+                if gen0 == 0:
+                    bCycle = testPatt == g.transform(g.getcells(r),-r[0],-r[1])
+                    cycle = None
+                else:
+                    disp, cycle = sss.runCycle(period)
+                    bCycle = disp == (r[0] - x0, r[1] - y0)
+            if gen0:
+                gen += period
+                if not bCycle:
+                    # Hash collision, continue from the current phase
+                    continue
+            if bCycle:
+                dy, dx = sss.minmaxofabs((r[0] - x0, r[1] - y0))
+                result = classify(dx, dy, period)
+                endTest('found' if result else 'lowPeriod', stabGen+gen, (dx, dy, period))
+                if result and phases is not None:
+                    phases[:] = cycle or sss.runCycle(period)[1]
+                return result
+        seen[key] = (gen, r[0], r[1])
+        # Stability check for patterns which keep growing
+        if growthChecks and ((gen-1) % stabCheckP == 0):
+            dim = max(r[2:4])
+            if dim > lastDim:
+                Ngrowth += 1
+                if Ngrowth >= growthChecks:
+                    endTest('growth', stabGen+gen)
+                    return ()
+            else:
+                Ngrowth = 0
+            lastDim = dim
+    endTest('maxGen', stabGen+gen)
+    return ()
+
+# Periodicity test of a pattern evolving in one rule, for the headless
+# simulator (see testRules)
+# check() applies the tests of testRule to each generation after the
+# stabilisation time, given the generation (counted from the end of the
+# stabilisation time), population, bounding box, hash and cell array (the
+# pattern in its bounding box) of the pattern. Returns None while the test is
+# undecided, otherwise the stage of the outcome, the result (as testRule) and
+# the cycle (as in lastOutcome).
+# A repeat of a later phase is verified by evolving the pattern for another
+# period, check() then skips the tests until the period is complete and
+# compares the pattern with the repeated phase.
+class PhaseTest(object):
+    def __init__(self, pop, rect, key, patt):
+        x, y, w, h = rect
+        self.seen = {(pop, w, h, key): (0, x, y)}
+        self.testPatt = patt.copy()
+        self.lastDim = max(w, h)
+        self.Ngrowth = 0
+        self.verify = None
+
+    def copy(self):
+        other = copy.copy(self)
+        other.seen = dict(self.seen)
+        return other
+
+    def cycle(self, disp, period):
+        dy, dx = sss.minmaxofabs(disp)
+        result = classify(dx, dy, period)
+        return ('found' if result else 'lowPeriod'), result, (dx, dy, period)
+
+    def check(self, gen, pop, rect, key, patt):
+        x, y, w, h = rect
+        if self.verify:
+            vgen, (vx, vy, disp), vpatt, period = self.verify
+            if gen < vgen:
+                return None
+            self.verify = None
+            if pop and (x - vx, y - vy) == disp and np.array_equal(patt, vpatt):
+                return self.cycle(disp, period)
+            if gen >= maxGen:
+                # Hash collision, no more generations to test
+                return 'maxGen', (), ()
+            return None
+        if (pop < minPop or pop > maxPop):
+            return 'pop', (), ()
+        dim = max(w, h)
+        # BBox expansion
+        if maxDim > 0 and dim > maxDim:
+            return 'bbox', (), ()
+        key = (pop, w, h, key)
+        if key in self.seen:
+            # Test for periodicity
+            gen0, x0, y0 = self.seen[key]
+            period = gen - gen0
+            disp = (x - x0, y - y0)
+            if gen0 == 0:
+                if np.array_equal(patt, self.testPatt):
+                    return self.cycle(disp, period)
+            else:
+                # Verify by running the cycle once more
+                self.verify = (gen + period, (x, y, disp), patt.copy(), period)
+                return None
+        self.seen[key] = (gen, x, y)
+        # Stability check for patterns which keep growing
+        if growthChecks and ((gen-1) % stabCheckP == 0):
+            if dim > self.lastDim:
+                self.Ngrowth += 1
+                if self.Ngrowth >= growthChecks:
+                    return 'growth', (), ()
+            else:
+                self.Ngrowth = 0
+            self.lastDim = dim
+        if gen >= maxGen:
+            return 'maxGen', (), ()
+        return None
+
+# Test pattern in a batch of rules
+# Vectorized version of testRule for the headless simulator: the pattern is
+# evolved in all the rules at once (isosim.BatchGrid), and each rule goes
+# through the same cascade of tests as in testRule (see PhaseTest), with the
+# same outcomes and statistics. Rules are removed from the batch as soon as
+# they are resolved. Phases are identified by population, bounding box size
+# and a Zobrist hash of the pattern in its bounding box.
+# With decided (DecidedRules) given, rules which it contains are not tested
+# and rejected rules are added to it.
+# Returns a list with the result for each rule (as testRule), a list with the
+# pattern (cell list) in a phase of the cycle for each interesting result
+# (None for other rules) and a list with the outcome of each rule (as in
+# lastOutcome, None for rules which were not tested).
+@sssprof.profiled('testRules')
+def testRules(rules, origPatt, stabGen, decided=None):
+    import isosim
+    rules = [rule if isinstance(rule, sss.IsoRule) else isosim.parseRule(rule)
+             for rule in rules]
+    for rule in rules:
+        if rule.b & 1:
+            raise RuntimeError('B0 rules are not supported: %s' % rule)
+    results = [()] * len(rules)
+    patts = [None] * len(rules)
+    outcomes = [None] * len(rules)
+    ids = list(range(len(rules)))
+    if decided is not None:
+        ids = [k for k in ids if not rules[k] in decided]
+        for _ in range(len(rules) - len(ids)):
+            countStage('equiv', 0)
+    if not ids:
+        return results, patts, outcomes
+    batch = isosim.BatchGrid(origPatt, [isosim.ruleTable(rules[k]) for k in ids],
+                             track=decided is not None)
+    batch.run(stabGen)
+    pops = batch.pops()
+    for i in np.flatnonzero(pops == 0):
+        countStage('stabDied', stabGen)
+        outcomes[ids[i]] = ('stabDied', ())
+    for i in np.flatnonzero((pops > 0) & ((pops < minPop) | (pops > maxPop))):
+        countStage('stabPop', stabGen)
+        outcomes[ids[i]] = ('stabPop', ())
+    keep = (pops >= minPop) & (pops <= maxPop)
+    if decided is not None:
+        for i in np.flatnonzero(~keep):
+            decided.add(rules[ids[i]], *batch.usedMasks(i))
+    ids = [ids[i] for i in np.flatnonzero(keep)]
+    if not ids:
+        return results, patts, outcomes
+    batch.select(keep)
+    tests = [PhaseTest(pop, rect, key, batch.getarray(i)) for i, (pop, rect, key) in
+             enumerate(zip(batch.pops().tolist(), batch.rects(), batch.hashes().tolist()))]
+    gen = 0
+    while len(batch):
+        batch.step()
+        gen += 1
+        keep = [True] * len(batch)
+        for i, (test, pop, rect, key) in enumerate(zip(tests, batch.pops().tolist(),
+                                                       batch.rects(), batch.hashes().tolist())):
+            outcome = test.check(gen, pop, rect, key, batch.getarray(i))
+            if outcome:
+                stage, result, cycle = outcome
+                countStage(stage, stabGen+gen)
+                outcomes[ids[i]] = ('cycle' if cycle else stage), cycle
+                if result:
+                    results[ids[i]] = result
+                    patts[ids[i]] = batch.getcells(i)
+                elif decided is not None:
+                    decided.add(rules[ids[i]], *batch.usedMasks(i))
+                keep[i] = False
+        if not all(keep):
+            idx = [i for i in range(len(keep)) if keep[i]]
+            batch.select(np.array(idx, dtype=np.intp))
+            ids = [ids[i] for i in idx]
+            tests = [tests[i] for i in idx]
+    return results, patts, outcomes
+
+# Result of an outcome (as in lastOutcome) with the current parameters
+def outcomeResult(outcome):
+    stage, cycle = outcome
+    return classify(*cycle) if stage == 'cycle' else ()
+
+# Test pattern in given rule with an outcome cache (rulecache.OutcomeCache)
+# Rules rejected in a previous search are not tested again (and are counted
+# as 'cached'), other rules are tested with testRule and their outcome is
+# added to the cache.
+def cachedTestRule(rule, origPatt, stabGen, cache, phases=None):
+    outcome = cache.get(rule)
+    if outcome and not outcomeResult(outcome):
+        countStage('cached', 0)
+        return ()
+    result = testRule(rule, origPatt, stabGen, phases)
+    cache.put(rule, *lastOutcome)
+    return result
+
+# Test each rule of a sequence of rules
+# A generator yielding the result of testRule for each rule. With batchSize > 1
+# the rules are tested in batches with testRules, and the pattern of each
+# interesting result is put in the current layer (with its rule set) before
+# the result is yielded, so in either case the pattern is left in a phase of
+# the cycle. The record of the cycle of each interesting result is in lastCycle
+# (recorded by testRule, or by running the pattern placed in the layer for one
+# period).
+# With decided (DecidedRules) given, rules which it contains are rejected
+# without being tested and rejected rules are added to it (the rules must be
+# sss.IsoRule objects and the backend must support transition tracking, see
+# isosim.Headless.trackTransitions).
+# With cache (rulecache.OutcomeCache) given, rules rejected in previous
+# searches are not tested again (see cachedTestRule).
+def iterResults(rules, origPatt, stabGen, batchSize=1, decided=None, cache=None):
+    global lastCycle
+    g = sss.getBackend()
+    if batchSize <= 1:
+        for rule in rules:
+            if decided is not None:
+                if rule in decided:
+                    countStage('equiv', 0)
+                    yield ()
+                    continue
+                g.trackTransitions()
+            if cache is not None:
+                outcome = cache.get(rule)
+                if outcome and not outcomeResult(outcome):
+                    countStage('cached', 0)
+                    yield ()
+                    continue
+            cycle = []
+            result = testRule(rule, origPatt, stabGen, cycle)
+            if cache is not None:
+                cache.put(rule, *lastOutcome)
+            if decided is not None and not result:
+                decided.add(rule, *g.usedTransitions())
+            if result:
+                lastCycle = cycle
+            yield result
+        return
+    rules = iter(rules)
+    while True:
+        batch = list(itertools.islice(rules, batchSize))
+        if not batch:
+            return
+        skip = [False] * len(batch)
+        if cache is not None:
+            skip = [bool(outcome) and not outcomeResult(outcome)
+                    for outcome in map(cache.get, batch)]
+            for _ in range(sum(skip)):
+                countStage('cached', 0)
+        tested = [rule for rule, bSkip in zip(batch, skip) if not bSkip]
+        results, patts, outcomes = testRules(tested, origPatt, stabGen, decided)
+        if cache is not None:
+            for rule, outcome in zip(tested, outcomes):
+                if outcome:
+                    cache.put(rule, *outcome)
+        tested = iter(zip(tested, results, patts))
+        for bSkip in skip:
+            if bSkip:
+                yield ()
+                continue
+            rule, result, patt = next(tested)
+            if result:
+                g.new('')
+                g.putcells(patt)
+                sss.setrule(rule)
+                lastCycle = sss.runCycle(result[2])[1]
+            yield result
+
+# Rules decided by the transitions exercised by the pattern
+# The evolution of the pattern only depends on the transitions it exercises,
+# so when a rule is rejected every rule which agrees with it on the exercised
+# free transitions (the B_OK and S_OK transitions which are not needed) would
+# be rejected in the same way, and does not need to be tested. Rejections are
+# recorded by the mask of exercised free transitions and the rule's values for
+# them, a rule is in the decided rules if it matches the values recorded for
+# any mask. A mask of N transitions only decides 2^-N of the rule space, so
+# masks with more than maxBits transitions are not recorded, and at most
+# maxMasks different masks are kept (a lookup tests every mask).
+class DecidedRules(object):
+    maxBits = 12
+    maxMasks = 256
+
+    def __init__(self, B_OK, S_OK, B_need=[], S_need=[]):
+        self.bFree = sss.transMask(B_OK) & ~sss.transMask(B_need)
+        self.sFree = sss.transMask(S_OK) & ~sss.transMask(S_need)
+        self.masks = {}
+
+    # Record a rejected rule given the transitions exercised by the pattern
+    def add(self, rule, bUsed, sUsed):
+        bMask, sMask = bUsed & self.bFree, sUsed & self.sFree
+        if bin(bMask).count('1') + bin(sMask).count('1') > self.maxBits:
+            return
+        values = self.masks.get((bMask, sMask))
+        if values is None:
+            if len(self.masks) >= self.maxMasks:
+                return
+            values = self.masks[(bMask, sMask)] = set()
+        values.add((rule.b & bMask, rule.s & sMask))
+
+    def __contains__(self, rule):
+        for (bMask, sMask), values in self.masks.items():
+            if (rule.b & bMask, rule.s & sMask) in values:
+                return True
+        return False
+
+# Search the whole rule space with a shared-prefix evolution tree
+# All the rules of a search (with the B_need and S_need transitions, and any
+# of the other B_OK and S_OK transitions) evolve the pattern identically until
+# one of the free transitions is first exercised. The pattern is evolved once
+# up to that generation, where the evolution branches on the transition
+# (absent or present), so the tree only branches on transitions which affect
+# the evolution. Each leaf is the outcome of testRule for all the rules which
+# agree on the transitions decided along its branch (2^N rules, for N free
+# transitions never exercised), so the number of evolutions is far smaller than
+# the size of the rule space. Statistics count the rules decided by each leaf
+# and the generations actually simulated.
+# The tree is split between Nworkers workers: the subtrees splitDepth branches
+# below the root (and leaves above them) are numbered in depth first order and
+# worker k only explores those with numbers k, k+Nworkers, k+2*Nworkers, ...
+# A generator yielding the result and the number of rules decided for each
+# leaf. The pattern of each interesting result is put in the current layer,
+# with its rule set (free transitions which were never exercised absent), and
+# the record of its cycle in lastCycle.
+def searchTree(origPatt, stabGen, B_OK, S_OK, B_need=[], S_need=[],
+               worker=0, Nworkers=1, splitDepth=None):
+    global lastCycle
+    import isosim
+    if splitDepth is None:
+        splitDepth = (Nworkers - 1).bit_length() + 4 if Nworkers > 1 else 0
+    g = sss.getBackend()
+    bNeed, sNeed = sss.transMask(B_need), sss.transMask(S_need)
+    # B0 is never free (not supported)
+    bFree = sss.transMask(B_OK) & ~bNeed & ~1
+    sFree = sss.transMask(S_OK) & ~sNeed
+    # Tests of each generation, from the end of the stabilisation time
+    # Returns the outcome (stage and result) or None, and the phase test
+    def check(grid, gen, test):
+        pop = grid.getpop()
+        if gen == stabGen:
+            if pop == 0:
+                return ('stabDied', ()), test
+            if (pop < minPop or pop > maxPop):
+                return ('stabPop', ()), test
+            return None, PhaseTest(pop, grid.getrect(), grid.zobristHash(), grid.cells)
+        return test.check(gen - stabGen, pop, grid.getrect() or [0, 0, 0, 0],
+                          grid.zobristHash(), grid.cells), test
+    # Nodes are (rule masks, free masks, grid, generation, phase test, depth,
+    # generations simulated, outcome)
+    grid = isosim.Grid(origPatt)
+    outcome, test = check(grid, 0, None) if stabGen == 0 else (None, None)
+    stack = [((bNeed, sNeed), (bFree, sFree), grid, 0, test, 0, 0, outcome)]
+    unit = 0
+    while stack:
+        (b, s), (bFree, sFree), grid, gen, test, depth, gens, outcome = stack.pop()
+        if depth == splitDepth:
+            unit += 1
+            if (unit - 1) % Nworkers != worker:
+                continue
+        table = isosim.ruleTable(sss.IsoRule(b, s))
+        free = isosim.ruleTable(sss.IsoRule(bFree, sFree)).astype(bool)
+        grid = copy.copy(grid)
+        while not outcome:
+            if gen < stabGen and not grid.cells.size:
+                # Died during the stabilisation time
+                outcome = 'stabDied', ()
+                gens += stabGen - gen
+                break
+            codes = isosim.nbhdCodes(grid.cells)
+            exercised = free[codes]
+            if exercised.any():
+                # Branch on the first free transition exercised
+                code = int(codes.ravel()[exercised.ravel().argmax()])
+                bit = 1 << int(isosim.nbhdTransIdx[code])
+                if code & 16:
+                    children = [((b, s | bit), (bFree, sFree & ~bit)),
+                                ((b, s), (bFree, sFree & ~bit))]
+                else:
+                    children = [((b | bit, s), (bFree & ~bit, sFree)),
+                                ((b, s), (bFree & ~bit, sFree))]
+                for k, (rule, freeMasks) in enumerate(children):
+                    stack.append((rule, freeMasks, grid, gen, test.copy() if test and not k else test,
+                                  depth + 1, gens if k else 0, None))
+                break
+            grid.cells = table[codes]
+            grid.x0 -= 1
+            grid.y0 -= 1
+            grid.crop()
+            gen += 1
+            gens += 1
+            if gen >= stabGen:
+                outcome, test = check(grid, gen, test)
+        if not outcome:
+            continue
+        if depth < splitDepth:
+            unit += 1
+            if (unit - 1) % Nworkers != worker:
+                continue
+        stage, result = outcome[0:2]
+        Nrules = 1 << (bin(bFree).count('1') + bin(sFree).count('1'))
+        countStage(stage, gens, Nrules)
+        if result:
+            g.new('')
+            g.putcells(grid.getcells())
+            sss.setrule(sss.IsoRule(b, s))
+            lastCycle = sss.runCycle(result[2])[1]
+        yield result, Nrules
+
+# Find the minimum population phase of a periodic pattern
+# Returns the minimum population and the generation where it occurs. Given the
+# record of the pattern's cycle starting with the current phase (phases, from
+# testRule or lastCycle), the minimum is found from the record, otherwise the
+# pattern is run for one period (returning it to the starting phase).
+@sssprof.profiled('findMinPop')
+def findMinPop(period, phases=None):
+    if phases and len(phases) == period:
+        return min((pop, gen) for gen, (pop, rect, clist) in enumerate(phases))
+    g = sss.getBackend()
+    minpop = int(g.getpop())
+    mingen = 0
+    for gen in xrange(1, period):
+        g.run(1)
+        pop = int(g.getpop())
+        if pop < minpop:
+            minpop = pop
+            mingen = gen
+    g.run(1)
+    return minpop, mingen
+
+# Convert a search result to a ship in sss format
+# The phases of one period from the current phase, from the record of the
+# pattern's cycle (phases, as for findMinPop) or by running the pattern
+# (sss.cycleCells), give the ship in the minimum population phase (generation
+# mingen) and the minimal isotropic rule supporting the result, which is set.
+@sssprof.profiled('getShip')
+def getShip(result, minpop, mingen, phases=None):
+    g = sss.getBackend()
+    dx, dy, period = result
+    if phases and len(phases) == period:
+        clists = [clist for pop, rect, clist in phases]
+    else:
+        clists = sss.cycleCells(period)
+    shipRLE = sss.giveRLE(clists[mingen])
+    sss.setminisorule(period, clists)
+    return (minpop, g.getrule(), dx, dy, period, shipRLE)
+
+def describe(result):
+    dx, dy, period = result
+    if dy == 0:
+        if dx == 0:
+            return 'Found oscillator with period = %d' % period
+        return 'Found orthogonal spaceship with speed = %dc/%d' % (dx, period)
+    elif dy == dx:
+        return 'Found diagonal spaceship with speed = %dc/%d' % (dx, period)
+    return 'Found knightship with speed = (%d, %d)c/%d' % (dx, dy, period)
+
+# Load known speeds from an sss file into the foundSpeeds dictionary
+# Returns 1 if the file can not be read
+def loadKnownSpeeds(shipFile, foundSpeeds):
+    try:
+        with open(shipFile, 'r') as rF:
+            for line in rF:
+                # Trust the data in the sss file, no need to test ships
+                ship = sss.parseshipstr(line)
+                if not ship:
+                    continue
+                minpop, _, dx, dy, period, _ = ship
+                sssdb.recordSpeed(foundSpeeds, (dx, dy, period), minpop)
+    except IOError:
+        return 1
+    return 0
+
+# Known speeds of the 5S project
+# The 5S collections are read from the collection store (sssdb.py), each
+# collection is only imported from its sss file when the file has changed
+# (and updated with the ships recorded in its journal, see sssjournal.py).
+# Returns the known speeds (sssdb.KnownSpeeds, with the speeds found by the
+# search recorded in local) or None if a collection can not be found.
+def load5SSpeeds(storeFile=sssdb.storeFile, shipFiles=sssdb.collectionFiles, local=None):
+    store = sssdb.ShipStore(storeFile)
+    for collection, shipFile in shipFiles.items():
+        if not sssjournal.syncCollection(store, collection, shipFile):
+            store.close()
+            return None
+    return sssdb.KnownSpeeds(store, local)
+
+# Search checkpoints
+# A checkpoint records the rule iterator state(s) and the known speeds of a
+# search so that it can be resumed after being interrupted. The search
+# description (from searchDesc) identifies the search, checkpoints are only
+# loaded for an identical search.
+def searchDesc(origPatt, origRule, numgen, stabGen, seed):
+    return dict(pattern=sss.giveRLE(origPatt), rule=origRule, numgen=numgen,
+                stabGen=stabGen, seed=seed)
+
+def saveCheckpoint(fileName, search, iterStates, foundSpeeds, Nfound):
+    ckpt = dict(search=search, iterators=iterStates, Nfound=Nfound,
+                foundSpeeds=[list(speed) + [minpop] for speed, minpop in foundSpeeds.items()])
+    with open(fileName + '.tmp', 'w') as f:
+        json.dump(ckpt, f)
+    sss.replaceFile(fileName + '.tmp', fileName)
+
+# Load a checkpoint for the given search
+# Known speeds from the checkpoint are merged into foundSpeeds. Returns the
+# checkpoint or None if there is no checkpoint for the search.
+def loadCheckpoint(fileName, search, foundSpeeds):
+    try:
+        with open(fileName) as f:
+            ckpt = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if not ckpt.get('search') == search:
+        return None
+    for dx, dy, period, minpop in ckpt['foundSpeeds']:
+        sssdb.recordSpeed(foundSpeeds, (dx, dy, period), minpop)
+    return ckpt
+
+def removeCheckpoint(fileName):
+    if os.path.exists(fileName):
+        os.remove(fileName)
+
+# Leave handling of Ctrl-C to the main process of a parallel search
+def ignoreInterrupt():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+# Worker process for parallel searches
+# Tests the rules with index start, start+Nworkers, start+2*Nworkers, ... in
+# the search's rule iterator using the headless simulator, where start is the
+# worker's entry in search['starts'] (initially the worker number), in batches
+# of search['batch'] rules (see testRules), or the worker's share of the
+# evolution tree if search['tree'] is set (see searchTree). Unless
+# search['equiv'] is False, rules which agree with a rejected rule on all the
+# transitions exercised by the pattern are skipped (see DecidedRules).
+# Outcomes are cached in search['cacheFile'] if it is set (see rulecache.py).
+# New speeds are recorded in the shared foundSpeeds dictionary (protected by
+# lock), or in the known speeds shared with other searches
+# search['speedsFile'] if it is set (see sssdb.SharedSpeeds), combined with
+# the 5S collection store search['storeFile'] if given, and reported through
+# queue along with progress updates:
+#   ('ship', worker, shipstr)
+#   ('progress', worker, (Ntested, testStats, profile))
+#   ('done', worker, (Ntested, testStats, profile))
+# where Ntested is the number of rules tested by the worker since start and
+# profile the worker's sssprof counters (empty unless search['profile']). If
+# the worker fails it reports the exception instead of 'done':
+#   ('error', worker, traceback)
+def searchWorker(worker, search, foundSpeeds, lock, queue):
+    try:
+        import isosim
+        ignoreInterrupt()
+        sss.setBackend(isosim.Headless())
+        if search['profile']:
+            sssprof.enable()
+        setParams(**search['params'])
+        if search['speedsFile']:
+            foundSpeeds = sssdb.SharedSpeeds(search['speedsFile'])
+        if search['storeFile']:
+            foundSpeeds = sssdb.KnownSpeeds(sssdb.ShipStore(search['storeFile']), foundSpeeds)
+        rules = sss.iterRule(search['B_OK'], search['S_OK'], search['B_need'],
+                             search['S_need'], seed=search['seed'])
+        rules = rules.slice(search['starts'][worker], search['maxRules'], search['Nworkers'])
+        g = sss.getBackend()
+        ii = 0
+        cache = None
+        if search['tree']:
+            results = searchTree(search['origPatt'], search['stabGen'], search['B_OK'],
+                                 search['S_OK'], search['B_need'], search['S_need'],
+                                 worker, search['Nworkers'])
+        else:
+            decided = None
+            if search['equiv']:
+                decided = DecidedRules(search['B_OK'], search['S_OK'], search['B_need'],
+                                       search['S_need'])
+            if search['cacheFile']:
+                cache = rulecache.OutcomeCache(search['cacheFile'], search['origPatt'],
+                                               search['stabGen'], getParams())
+            results = ((result, 1) for result in
+                       iterResults(rules, search['origPatt'], search['stabGen'], search['batch'],
+                                   decided, cache))
+        Nresults = 0
+        for result, Nrules in results:
+            ii += Nrules
+            Nresults += 1
+            if result and (not result in search['ignoreResults']):
+                minpop, mingen = int(g.getpop()), 0
+                if search['bUniqueSpeeds']:
+                    minpop, mingen = findMinPop(result[2], lastCycle)
+                    with lock:
+                        if not sssdb.recordSpeed(foundSpeeds, result, minpop):
+                            # Skip this speed unless the current ship is smaller
+                            continue
+                newship = getShip(result, minpop, mingen, lastCycle)
+                queue.put(('ship', worker, ', '.join(map(str, newship))))
+            if (Nresults % search['updateP'] == 0):
+                queue.put(('progress', worker, (ii, testStats, sssprof.snapshot())))
+        if cache is not None:
+            cache.close()
+        queue.put(('done', worker, (ii, testStats, sssprof.snapshot())))
+    except Exception:
+        queue.put(('error', worker, traceback.format_exc()))
@@ -0,0 +1,129 @@
+# rulecache.py
+# Persistent cache of rule test outcomes for the match pattern searches
+# The outcome of matchpatt.testRule only depends on the starting pattern, the
+# rule, the stabilisation time and the search parameters which limit the
+# evolution (maxGen, maxPop, maxDim, stabCheckP, growthChecks and minPop). The
+# outcome of every rule tested is stored in an SQLite database keyed by a hash
+# of the pattern (in canonical orientation, the rules are isotropic), the
+# stabilisation time and those parameters (searchKey), and by the rule's
+# transition bitmasks. Recently used outcomes are also kept in memory (LRU).
+#
+# Periodic outcomes are stored as the canonical displacement and period of the
+# cycle (stage 'cycle') rather than as found or lowPeriod, and are classified
+# again with the current parameters (matchpatt.classify), so the cache is
+# shared by searches with different seeds and classification parameters
+# (minShipP, minSpeed, ...).
+#   import rulecache
+#   cache = rulecache.OutcomeCache('matchPatt2-cache.sqlite', origPatt, stabGen,
+#                                  matchpatt.getParams())
+#   cache.get(rule)  # (stage, (dx, dy, period)) or None
+#   cache.put(rule, 'pop', ())
+#   cache.close()
+
+import collections
+import hashlib
+import json
+import sqlite3
+import sss
+import sssrle
+
+# Search parameters which change the outcome of a test (rather than its
+# classification)
+evolutionParams = ('maxGen', 'maxPop', 'maxDim', 'stabCheckP', 'growthChecks', 'minPop')
+
+schema = '''
+CREATE TABLE IF NOT EXISTS outcomes (
+    search TEXT NOT NULL,
+    rule TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    dx INTEGER,
+    dy INTEGER,
+    period INTEGER,
+    PRIMARY KEY (search, rule)
+) WITHOUT ROWID;
+'''
+
+# Canonical rle of a pattern (minimal rle over the 8 orientations)
+def canonPattern(clist):
+    cells = list(zip(clist[0::2], clist[1::2]))
+    rles = [sssrle.encode([c for x, y in cells for c in (axx*x + axy*y, ayx*x + ayy*y)])
+            for axx, axy, ayx, ayy in sss.symmetries]
+    return min(rles, key=lambda rle: (len(rle), rle))
+
+# Key of the outcomes of a search: hash of the canonical pattern, the
+# stabilisation time and the evolution parameters
+def searchKey(origPatt, stabGen, params):
+    params = dict((k, params[k]) for k in evolutionParams)
+    desc = '%s %d %s' % (canonPattern(origPatt), stabGen, json.dumps(params, sort_keys=True))
+    return hashlib.sha1(desc.encode('ascii')).hexdigest()
+
+def ruleKey(rule):
+    if not isinstance(rule, sss.IsoRule):
+        rule = sss.IsoRule.fromString(str(rule))
+    return '%x:%x' % (rule.b, rule.s)
+
+class OutcomeCache(object):
+    # Number of outcomes kept in memory
+    memSize = 1 << 16
+    # Number of new outcomes written to the database in each transaction
+    commitSize = 1000
+
+    def __init__(self, fileName, origPatt, stabGen, params):
+        self.fileName = fileName
+        self.search = searchKey(origPatt, stabGen, params)
+        # Several search processes can share the database
+        self.db = sqlite3.connect(fileName, timeout=60)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.executescript(schema)
+        self.mem = collections.OrderedDict()
+        self.pending = []
+        self.hits = self.misses = 0
+
+    # Outcome of a rule as (stage, cycle), where cycle is (dx, dy, period) for
+    # stage 'cycle' and () otherwise, or None if the rule has not been tested
+    def get(self, rule):
+        key = ruleKey(rule)
+        outcome = self.mem.get(key)
+        if outcome is None:
+            row = self.db.execute('SELECT stage, dx, dy, period FROM outcomes '
+                                  'WHERE search = ? AND rule = ?', (self.search, key)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            outcome = (row[0], tuple(row[1:]) if row[0] == 'cycle' else ())
+            self.remember(key, outcome)
+        else:
+            # Most recently used last
+            self.mem[key] = self.mem.pop(key)
+        self.hits += 1
+        return outcome
+
+    def put(self, rule, stage, cycle=()):
+        key = ruleKey(rule)
+        self.remember(key, (stage, tuple(cycle)))
+        dx, dy, period = cycle if cycle else (None, None, None)
+        self.pending.append((self.search, key, stage, dx, dy, period))
+        if len(self.pending) >= self.commitSize:
+            self.commit()
+
+    def remember(self, key, outcome):
+        self.mem[key] = outcome
+        if len(self.mem) > self.memSize:
+            self.mem.popitem(last=False)
+
+    def commit(self):
+        if self.pending:
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?, ?, ?)',
+                                    self.pending)
+            self.pending = []
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.close()
@@ -18,13 +18,25 @@
 #   - Optionally loads previously found speeds from output file at start of
 #       search
 #   - Optionally also load ships from 5S project into record of known speeds
+#       (read from the 5S collection store, see sssdb.py)
+#   - Optionally shares the record of found speeds with concurrent searches
+#       (see sssdb.SharedSpeeds), so each new speed is reported once
+#   - Rejects candidate rules with a cascade of cheap tests (population,
+#       bounding box, phase hashes) before testing for periodicity, counts of
+#       each outcome are written to the results file at the end of the search
 #   - Random rule generator uses an iterator which pseudo randomly scans the
 #       entire rulespace
-#
-# Potential features to be added
-#   - XXX Save the random rule iterators' current state when interrupting the
-#       search so that it can be resumed (repeating the same search without
-#       changing the seed will search the same rules)
+#   - Optionally caches the outcome of each rule tested (see rulecache.py), so
+#       that rules rejected by a previous search of the same pattern (with any
+#       seed, minShipP, ...) are not tested again
+#   - Results are appended to the results file with buffered writes (see
+#       sssjournal.Journal), so several searches can share a results file
+#   - Optionally writes a profile of the search (time spent in each phase of
+#       the rule tests, see sssprof.py) when the search ends
+#   - Saves the random rule iterator's state and the known speeds to a
+#       checkpoint file periodically and when interrupting the search, so that
+#       it can be resumed (repeating the same search without changing the seed
+#       resumes from the checkpoint)
 
 from __future__ import division
 
@@ -32,6 +44,11 @@ import time
 import timeit
 import golly as g
 import sss
+import matchpatt
+import rulecache
+import sssdb
+import sssjournal
+import sssprof
 
 timer = timeit.default_timer
 xrange = sss.xrange
@@ -61,8 +78,27 @@ resultsFile = 'matchPatt2-test.txt'
 bUniqueSpeeds = True # True
 # Import 5S project into known speeds?
 bImport5S = True # True
+# 5S collection store (updated from the 5S sss files when they change)
+storeFile = sssdb.storeFile
+# Known speeds shared with concurrent searches (set to '' to disable)
+# - Searches sharing the file only report speeds (or smaller ships) which
+#   have not been found by any of them
+speedsFile = ''
 # Special case speeds to ignore (useful when bUniqueSpeeds = False)
 ignoreResults = [] # A list of the form: [(dx, dy, P)]
+# Checkpoint file (set to '' to disable)
+# - The search is resumed from the checkpoint when it is restarted with the
+#   same pattern, rule, number of generations and seed
+checkpointFile = 'matchPatt2-test.ckpt'
+# Minimum time between checkpoints (seconds)
+checkpointT = 300
+# Outcome cache file (set to '' to disable)
+# - Shared by searches of the same pattern with the same stabilisation time,
+#   maxGen, maxPop, maxDim, stabCheckP and growthChecks
+cacheFile = ''
+# Profile file (set to '' to disable)
+# - JSON, or CSV if the file name ends with '.csv'
+profileFile = ''
 
 # Number of generations to match pattern behaviour
 s = g.getstring('How many generations to remain unchanged:', '', 'Rules calculator')
@@ -81,115 +117,49 @@ seed = 1
 stabCycles = 5 # 5
 stabGen = stabCycles * numgen
 # Stability check periodicity
-# - Used to detect if pattern becomes periodic after initial stabilisation time
-#   Pattern won't be detected as an oscillator or spaceship, just avoids
-#   simulting until maxGen generations have passed.
+# - Patterns which become periodic after the initial stabilisation time are
+#   detected as soon as any phase repeats (see matchpatt.testRule)
+# - Every stabCheckP generations the bounding box is checked for growth, the
+#   test is aborted if it grows in growthChecks consecutive checks (0 to
+#   disable). Avoids simulating until maxGen generations have passed.
 stabCheckP = 24 # 24
+growthChecks = 8 # 8
 
 # Minimum population criteria
 # - Probably redundant now that stability checking has been added
 if bOsc: minPop = 2 # Patterns with 0, or 1 cells can not be oscillators
 else: minPop = 3 # Patterns with 0, 1, or 2 cells can not be ships
 
-# Test pattern in given rule
-# Original pattern is evolved in the given randomly generated rule.
-# Pattern is evolved for a short stabilisation period and then tested to
-# determine if it has become an oscillator or a spaceship. 
-def testRule(rulestr):
-    r = g.getrect()
-    if r:
-        g.select(r)
-        g.clear(0)
-    g.putcells(origPatt)
-    g.setrule(rulestr)
-    g.run(stabGen)
-    if g.empty():
-        return ()
-    pop = int(g.getpop())
-    if (pop < minPop or pop > maxPop):
-        return ()
-    r = g.getrect()
-    testPatt = g.transform(g.getcells(r),-r[0],-r[1])
-    testPop = int(g.getpop())
-    testRect = g.getrect()
-    stabPatt = list(testPatt)
-    stabPop = testPop
-    for ii in xrange(maxGen):
-        g.run(1)
-        pop = int(g.getpop())
-        if (pop < minPop or pop > maxPop):
-            break
-        if (pop == testPop):
-            # Test for periodicity
-            r = g.getrect()
-            if testPatt == g.transform(g.getcells(r),-r[0],-r[1]):
-                period = ii+1
-                dy, dx = sss.minmaxofabs((r[0] - testRect[0], r[1] - testRect[1]))
-                if (dx == 0):
-                    # Oscillator (reject if low period or bOsc is False)
-                    if bOsc and period >= minOscP:
-                        return (0, 0, period)
-                elif ( period >= minShipP ):
-                    # Spaceship
-                    return (dx, dy, period)
-                elif ( (dx + dy/1.9) / (period * 1.0) > minSpeed and period >= fastShipP ):
-                    # Fast spaceship
-                    return (dx, dy, period)
-                break # Pattern is a low period oscillator or spaceship
-        # Stability check
-        if (ii % stabCheckP == 0):
-            r = g.getrect()
-            # First check for BBox expansion
-            if maxDim > 0 and max(r[2:4]) > maxDim:
-                # Pattern is expanding
-                # XXX Attempt to separate components expanding in different directions
-                break
-            currPatt = g.transform(g.getcells(r),-r[0],-r[1])
-            if (pop == stabPop and currPatt == stabPatt):
-                # Pattern has stabilised to low period oscillator / spaceship
-                break
-            stabPop = pop
-            stabPatt = list(currPatt)
-    return ()
+matchpatt.setParams(minShipP=minShipP, minSpeed=minSpeed, fastShipP=fastShipP,
+        minOscP=minOscP, maxGen=maxGen, maxPop=maxPop, maxDim=maxDim, bOsc=bOsc,
+        stabCheckP=stabCheckP, growthChecks=growthChecks, minPop=minPop)
+
+# Test pattern in given rule (see matchpatt.testRule)
+cache = None
+def testRule(rule, phases=None):
+    if cache:
+        return matchpatt.cachedTestRule(rule, origPatt, stabGen, cache, phases)
+    return matchpatt.testRule(rule, origPatt, stabGen, phases)
 
 # Preload foundSpeeds from existing results file
-foundSpeeds = {}
+foundSpeeds = sssdb.SharedSpeeds(speedsFile) if speedsFile else {}
 def loadKnownSpeeds(resultsFile):
-    global foundSpeeds
     g.show('Loading known speeds from file %s' % resultsFile)
-    try:
-        with open(resultsFile, 'r') as rF:
-            for line in rF:
-                # Trust the data in the sss file, no need to test ships
-                ship = sss.parseshipstr(line)
-                if not ship:
-                    continue
-                minpop, _, dx, dy, period, _ = ship
-                try:
-                    if foundSpeeds[(dx, dy, period)] <= minpop:
-                        # Skip this speed unless the current ship is smaller
-                        continue
-                except KeyError:
-                    pass
-                foundSpeeds[(dx, dy, period)] = minpop
-    except IOError:
-        return 1
-    return 0
+    return matchpatt.loadKnownSpeeds(resultsFile, foundSpeeds)
 
 if bImport5S:
     bUniqueSpeeds = True
-    shipFiles = ['Orthogonal ships.sss.txt', 'Diagonal ships.sss.txt', 'Oblique ships.sss.txt']
-else:
-    shipFiles = []
+    g.show('Loading known speeds from 5S collection store %s' % storeFile)
+    foundSpeeds = matchpatt.load5SSpeeds(storeFile, local=foundSpeeds)
+    if foundSpeeds is None:
+        g.exit('Failed to load 5S collection into store: %s' % storeFile)
     
 status = 'Results file: %s.' % resultsFile
 if bUniqueSpeeds:
     with open(resultsFile, 'a+') as rF:
         pass
-    shipFiles.append(resultsFile)
-    for F in shipFiles:
-        if loadKnownSpeeds(F):
-            g.exit('Failed to load known speeds from file: %s' % F)
+    if loadKnownSpeeds(resultsFile):
+        g.exit('Failed to load known speeds from file: %s' % resultsFile)
     status += ' %d known speeds loaded.' % len(foundSpeeds)
 
 # Set up the search with the current pattern
@@ -197,10 +167,15 @@ r = g.getrect()
 origPop = int(g.getpop())
 origPatt = g.transform(g.getcells(r),-r[0],-r[1])
 origRule = g.getrule()
+if cacheFile:
+    cache = rulecache.OutcomeCache(cacheFile, origPatt, stabGen, matchpatt.getParams())
+if profileFile:
+    sssprof.enable()
 
 Nfound = 0
 updateP = 1000
 lastRule = ''
+results = sssjournal.Journal(resultsFile)
 
 try:
     # Begin the search
@@ -215,76 +190,77 @@ try:
     S_OK = [t for t in S_OK if t not in S_need]
     rulespace = len(B_OK) + len(S_OK)
     status += ' Matching pattern works in 2^%d rules: %s' % (rulespace, rulerange)
+    
+    # Random rule iterator. Change seed to repeat search with different rules from given rulespace
+    search = matchpatt.searchDesc(origPatt, origRule, numgen, stabGen, seed)
+    rules = sss.iterRule(B_OK, S_OK, B_need, S_need, seed=seed)
+    if checkpointFile:
+        ckpt = matchpatt.loadCheckpoint(checkpointFile, search, foundSpeeds)
+        if ckpt:
+            rules = sss.iterRule(**ckpt['iterators'][0])
+            Nfound = ckpt['Nfound']
+            status += ' Resuming search after %d rules.' % rules.index
     g.show(status)
     g.update()
     time.sleep(2)
     
     # Results header
-    with open(resultsFile, 'a') as rF:
-        msg = '\n# Search results matching pattern %s for %d gen' % (sss.giveRLE(origPatt), numgen)
-        msg += ' in rule %s with searchRule-matchPatt2.py using seed=%d\n' % (origRule, seed)
-        rF.write(msg)
+    msg = '\n# Search results matching pattern %s for %d gen' % (sss.giveRLE(origPatt), numgen)
+    msg += ' in rule %s with searchRule-matchPatt2.py using seed=%d' % (origRule, seed)
+    if rules.index:
+        msg += ' (resumed after %d rules)' % rules.index
+    results.write(msg + '\n')
+    results.flush()
     
-    start_time = timer()
+    start_time = checkpoint_time = timer()
     
-    # Random rule iterator. Change seed to repeat search with different rules from given rulespace
-    for (ii, rule) in enumerate(sss.iterRuleStr(B_OK, S_OK, B_need, S_need, seed=seed), start=1):
-        result = testRule(rule)
+    ii = rules.index
+    for (ii, rule) in enumerate(rules, start=rules.index+1):
+        cycle = []
+        result = testRule(rule, cycle)
         if result and (not result in ignoreResults):
             minpop = int(g.getpop())
             mingen = 0
             if bUniqueSpeeds:
                 # Find minimum population
-                for gen in xrange(1, result[2]):
-                    g.run(1)
-                    pop = int(g.getpop())
-                    if pop < minpop:
-                        minpop = pop
-                        mingen = gen
-                g.run(1)
-                try:
-                    if foundSpeeds[result] <= minpop:
-                        # Skip this speed unless the current ship is smaller
-                        continue
-                except KeyError:
-                    pass
-                foundSpeeds[result] = minpop
+                minpop, mingen = matchpatt.findMinPop(result[2], cycle)
+                if not sssdb.recordSpeed(foundSpeeds, result, minpop):
+                    # Skip this speed unless the current ship is smaller
+                    continue
             # Interesting pattern found
             Nfound += 1
-            dx, dy, period = result
-            lastRule = rule
-            if dy == 0:
-                if dx == 0:
-                    description = 'Found oscillator with period = %d' % period
-                else:
-                    description = 'Found orthogonal spaceship with speed = %dc/%d' % (dx, period)
-            elif dy == dx:
-                description = 'Found diagonal spaceship with speed = %dc/%d' % (dx, period)
-            else:
-                description = 'Found knightship with speed = (%d, %d)c/%d' % (dx, dy, period)
-            g.show(description)
-            g.run(mingen)
-            shipRLE = sss.giveRLE(g.getcells(g.getrect()))
-            sss.setminisorule(period)
-            newship = (minpop, g.getrule(), dx, dy, period, shipRLE)
-            with open(resultsFile, 'a') as rF:
-                rF.write(', '.join(map(str, newship))+'\n')
+            lastRule = str(rule)
+            g.show(matchpatt.describe(result))
+            newship = matchpatt.getShip(result, minpop, mingen, cycle)
+            with sssprof.timed('write.results'):
+                results.append(newship)
         if (ii % updateP == 0):
             curr_time = timer()
             g.select([])
+            with sssprof.timed('write.results'):
+                results.flush()
             msg = '%d ships found after testing %d candidate rules out of 2^%d rule space' % (Nfound, ii, rulespace)
             msg += ', %d rules/second' % (updateP/(curr_time - start_time))
             start_time = curr_time
+            if checkpointFile and (curr_time - checkpoint_time > checkpointT):
+                with sssprof.timed('write.checkpoint'):
+                    matchpatt.saveCheckpoint(checkpointFile, search, [rules.getState()], foundSpeeds, Nfound)
+                checkpoint_time = curr_time
             g.show(msg)
             g.fit()
             g.setmag(3)
             g.update()
             event = g.getevent()
             if event == "key q none":
-                # Interrupt the search
-                # XXX Save the current state of the Rule generator's seed so that the search can be continued
+                # Interrupt the search, saving the rule iterator's state so that the search can be continued
+                if checkpointFile:
+                    matchpatt.saveCheckpoint(checkpointFile, search, [rules.getState()], foundSpeeds, Nfound)
                 break
             g.new('')
+    else:
+        # Entire rule space has been searched
+        if checkpointFile:
+            matchpatt.removeCheckpoint(checkpointFile)
             
 except IOError:
     g.note('Failed to open results file %s for writing!' % resultsFile)
@@ -292,6 +268,15 @@ except IOError:
 except Exception as e:
     raise
 finally:
+    if cache:
+        cache.close()
+    results.write('# Test statistics: %s\n' % matchpatt.statsReport(matchpatt.testStats))
+    results.close()
+    if profileFile:
+        sssprof.disable()
+        sssprof.writeReport(profileFile, testStats=matchpatt.testStats,
+                info=dict(script='searchRule-matchPatt2.py', pattern=sss.giveRLE(origPatt),
+                          rule=origRule, numgen=numgen, seed=seed, rulesTested=ii, shipsFound=Nfound))
     g.new('Search result')
     g.putcells(origPatt)
     if lastRule:
@@ -0,0 +1,342 @@
+# searchRule-parallel.py
+# Headless, multiprocess version of searchRule-matchPatt2.py
+# Searches for small oscillators and spaceships in the isotropic 2-state CA
+# rulespace where several phases of the starting pattern match the evolution
+# of the pattern in the given rule. Runs from the command line without Golly,
+# using the isosim simulator in a number of worker processes.
+#
+# The pseudo random rule sequence from sss.iterRuleStr is split into disjoint
+# strided ranges: worker k of N tests rules k, k+N, k+2N, ... (using the
+# iterator's jump ahead, so each worker starts immediately). Known speeds are
+# shared by all the workers and results are merged into a single sss format
+# results file (compatible with searchRule-matchPatt2.py), which is appended
+# to with buffered writes (see sssjournal.Journal).
+#
+# The workers' rule iterator states and the known speeds are saved to a
+# checkpoint file periodically and when the search is interrupted (Ctrl-C).
+# Running the same search again resumes from the checkpoint, using the same
+# number of workers as the interrupted search. If a worker fails (or dies),
+# the other workers are stopped, the checkpoint is saved and the search exits
+# with an error.
+#
+# With --batch K each worker evolves the pattern in K rules at once (see
+# matchpatt.testRules), which amortises the cost of each generation over the
+# rules in the batch. Results are the same as testing the rules one at a time.
+#
+# Rules which agree with a rejected rule on all the transitions exercised by
+# the pattern evolve the pattern identically, so they are rejected without
+# being tested (see matchpatt.DecidedRules, disable with --no-equiv).
+#
+# With --cache the outcome of every rule tested is stored in an outcome cache
+# (see rulecache.py), so rules rejected by a previous search of the same
+# pattern (with any seed and classification parameters) are not tested again.
+#
+# With --tree the whole rule space is searched with a shared-prefix evolution
+# tree (see matchpatt.searchTree) instead of testing rules in pseudo random
+# order: the pattern is evolved once for all the rules which agree on the
+# transitions exercised so far, branching only when another transition is
+# exercised. The number of rules tested is then the number of rules decided by
+# the evolutions. Tree searches are not checkpointed.
+#
+# With --speeds FILE the known speeds are shared with other searches using the
+# same file (see sssdb.SharedSpeeds): a speed (or a smaller ship) is only
+# reported by the first search to find it.
+#
+# With --profile FILE the time spent in each phase of the search (see
+# sssprof.py) is collected from all the workers and written to FILE as JSON
+# (or CSV if FILE ends with .csv), along with the outcome of the rule tests.
+#
+# Usage:
+#   python searchRule-parallel.py pattern.rle -n 4 [-w 8] [--seed 1]
+# The pattern file contains a pattern in rle format (the rule is read from the
+# rle header line) or a ship in sss format.
+
+from __future__ import division, print_function
+
+import argparse
+import multiprocessing
+import sys
+from multiprocessing.managers import SyncManager
+import timeit
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+import isosim
+import matchpatt
+import sss
+import sssdb
+import sssjournal
+import sssprof
+import sssrle
+
+timer = timeit.default_timer
+
+# Time to wait for a message from the workers before checking that they are
+# still alive (seconds)
+workerPollTime = 5.0
+
+# Read the starting pattern from a file in rle or sss format
+# Returns the pattern rle and rule string (empty if not given in the file)
+def readPattern(fileName):
+    with open(fileName) as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        ship = sss.parseshipstr(line.strip())
+        if ship:
+            return ship[5], ship[1]
+    clist, rulestr = sssrle.readRLE(lines)
+    return sss.giveRLE(clist), rulestr
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description='Headless parallel match pattern rule search')
+    parser.add_argument('pattern', help='file with the pattern to match in rle or sss format')
+    parser.add_argument('-n', '--numgen', type=int, required=True,
+                        help='number of generations to remain unchanged')
+    parser.add_argument('-r', '--rule', default='', help='rule (default: from pattern file)')
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('-s', '--seed', type=int, default=1, help='seed for random rule generator')
+    parser.add_argument('-o', '--results', default='matchPatt2-test.txt', help='results file')
+    parser.add_argument('-b', '--batch', type=int, default=1,
+                        help='number of rules each worker tests at once (default: 1)')
+    parser.add_argument('--no-equiv', action='store_true',
+                        help='test every rule, even when it is equivalent to a rejected rule')
+    parser.add_argument('--cache', default=None,
+                        help='outcome cache file, shared by searches of the same pattern')
+    parser.add_argument('--tree', action='store_true',
+                        help='search the whole rule space with a shared-prefix evolution tree')
+    parser.add_argument('--max-rules', type=int, default=None,
+                        help='stop after testing this many rules (default: whole rule space)')
+    parser.add_argument('--stab-cycles', type=int, default=5,
+                        help='stabilisation time as a multiple of numgen')
+    parser.add_argument('--all-speeds', action='store_true',
+                        help='report all results, not just new speeds')
+    parser.add_argument('--no-5s', action='store_true',
+                        help='do not import 5S project ships into known speeds')
+    parser.add_argument('--store', default=sssdb.storeFile,
+                        help='5S collection store (updated from the 5S sss files when they change)')
+    parser.add_argument('--speeds', default=None,
+                        help='known speeds file shared with concurrent searches')
+    parser.add_argument('--osc', action='store_true', help='also search for oscillators')
+    parser.add_argument('--min-ship-p', type=int, default=matchpatt.minShipP)
+    parser.add_argument('--max-gen', type=int, default=matchpatt.maxGen)
+    parser.add_argument('--max-pop', type=int, default=matchpatt.maxPop)
+    parser.add_argument('--max-dim', type=int, default=matchpatt.maxDim)
+    parser.add_argument('--update', type=float, default=10, help='status update interval (s)')
+    parser.add_argument('--checkpoint', default=None,
+                        help='checkpoint file (default: results file with .ckpt extension)')
+    parser.add_argument('--checkpoint-interval', type=float, default=300,
+                        help='minimum time between checkpoints (s)')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='start a new search even if a checkpoint exists')
+    parser.add_argument('--profile', default=None,
+                        help='write a profile of the search to this file (JSON, or CSV for .csv)')
+    args = parser.parse_args(argv)
+    if args.numgen < 1:
+        parser.error('Generations to match must be at least 1.')
+    if args.workers < 1:
+        parser.error('Number of workers must be at least 1.')
+    if args.batch < 1:
+        parser.error('Batch size must be at least 1.')
+    if args.tree and (args.max_rules is not None or args.batch > 1):
+        parser.error('--max-rules and --batch can not be used with --tree.')
+    if args.checkpoint is None:
+        args.checkpoint = args.results.rsplit('.', 1)[0] + '.ckpt'
+    return args
+
+def main(argv):
+    args = parseArgs(argv)
+    g = isosim.Headless()
+    sss.setBackend(g)
+    if args.profile:
+        sssprof.enable()
+
+    rle, rulestr = readPattern(args.pattern)
+    rulestr = args.rule or rulestr or 'B3/S23'
+    g.setrule(rulestr)
+    g.putcells(g.parse(rle))
+    if g.empty():
+        g.exit('No pattern found in file: %s' % args.pattern)
+    r = g.getrect()
+    origPatt = g.transform(g.getcells(r), -r[0], -r[1])
+    origRule = g.getrule()
+
+    bUniqueSpeeds = not args.all_speeds
+    foundSpeeds = {}
+    storeFile = None
+    if bUniqueSpeeds:
+        with open(args.results, 'a+'):
+            pass
+        if args.speeds:
+            foundSpeeds = sssdb.SharedSpeeds(args.speeds)
+        if not args.no_5s:
+            storeFile = args.store
+            foundSpeeds = matchpatt.load5SSpeeds(storeFile, local=foundSpeeds)
+            if foundSpeeds is None:
+                g.exit('Failed to load 5S collection into store: %s' % storeFile)
+        if matchpatt.loadKnownSpeeds(args.results, foundSpeeds):
+            g.exit('Failed to load known speeds from file: %s' % args.results)
+
+    # Determine the rulespace to search
+    g.new('MatchPatt')
+    g.putcells(origPatt)
+    g.setrule(origRule)
+    B_need, S_need, B_OK, S_OK = sss.getRuleRangeElems(args.numgen)
+    rulerange = sss.rulestringopt('B' + ''.join(sorted(B_need)) + '/S' + ''.join(sorted(S_need)) + \
+            ' - B' + ''.join(sorted(B_OK)) + '/S' + ''.join(sorted(S_OK)))
+    B_OK = [t for t in B_OK if t not in B_need]
+    S_OK = [t for t in S_OK if t not in S_need]
+    rulespace = len(B_OK) + len(S_OK)
+    print('%d known speeds loaded. Matching pattern works in 2^%d rules: %s' % \
+            (len(foundSpeeds), rulespace, rulerange), file=sys.stderr)
+
+    # Resume from checkpoint
+    stabGen = args.stab_cycles * args.numgen
+    searchDesc = matchpatt.searchDesc(origPatt, origRule, args.numgen, stabGen, args.seed)
+    iterState = sss.iterRuleStr(B_OK, S_OK, B_need, S_need, seed=args.seed).getState()
+    starts = list(range(args.workers))
+    Nfound = 0
+    ckpt = None
+    if not (args.no_resume or args.tree):
+        ckpt = matchpatt.loadCheckpoint(args.checkpoint, searchDesc, foundSpeeds)
+    if ckpt:
+        starts = [state['index'] for state in ckpt['iterators']]
+        Nfound = ckpt['Nfound']
+        args.workers = len(starts)
+        print('Resuming search from checkpoint %s with %d workers' % (args.checkpoint, args.workers),
+              file=sys.stderr)
+
+    params = matchpatt.getParams()
+    params.update(minShipP=args.min_ship_p, maxGen=args.max_gen, maxPop=args.max_pop,
+                  maxDim=args.max_dim, bOsc=args.osc)
+    params.pop('minPop')
+    search = dict(origPatt=origPatt, stabGen=stabGen,
+                  B_OK=B_OK, S_OK=S_OK, B_need=B_need, S_need=S_need, seed=args.seed,
+                  Nworkers=args.workers, starts=starts, maxRules=args.max_rules, params=params,
+                  bUniqueSpeeds=bUniqueSpeeds, ignoreResults=[], updateP=1000,
+                  storeFile=storeFile, speedsFile=args.speeds if bUniqueSpeeds else None,
+                  batch=args.batch, tree=args.tree,
+                  equiv=not args.no_equiv, cacheFile=args.cache, profile=bool(args.profile))
+
+    manager = SyncManager()
+    manager.start(matchpatt.ignoreInterrupt)
+    sharedSpeeds = manager.dict(foundSpeeds.items())
+    lock = multiprocessing.Lock()
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=matchpatt.searchWorker,
+                                       args=(k, search, sharedSpeeds, lock, queue))
+               for k in range(args.workers)]
+
+    # Iterator state of each worker, the next rule to test is at index
+    # start + Ntested*Nworkers
+    def iterStates():
+        return [dict(iterState, index=start + Ntested*args.workers)
+                for start, Ntested in zip(starts, tested)]
+    def checkpoint():
+        # Results found before the checkpoint must be saved
+        results.flush()
+        if args.tree:
+            return
+        with sssprof.timed('write.checkpoint'):
+            matchpatt.saveCheckpoint(args.checkpoint, searchDesc, iterStates(),
+                                     foundSpeeds, Nfound)
+
+    tested = [0] * args.workers
+    stats = [{} for _ in range(args.workers)]
+    profiles = [{} for _ in range(args.workers)]
+    running = args.workers
+    bDone = [False] * args.workers
+    failure = None
+    start_time = last_time = checkpoint_time = timer()
+    last_tested = 0
+    bComplete = False
+    results = sssjournal.Journal(args.results)
+    try:
+        msg = '\n# Search results matching pattern %s for %d gen' % (sss.giveRLE(origPatt), args.numgen)
+        msg += ' in rule %s with searchRule-parallel.py using seed=%d' % (origRule, args.seed)
+        if ckpt:
+            msg += ' (resumed after %d rules)' % sum(s // args.workers for s in starts)
+        results.write(msg + '\n')
+        results.flush()
+        for w in workers:
+            w.start()
+        while running:
+            try:
+                kind, worker, data = queue.get(timeout=workerPollTime)
+            except Empty:
+                # A worker's messages are in the queue before it exits, so a
+                # worker which has exited without reporting has died
+                dead = [k for k, w in enumerate(workers) if w.exitcode is not None and not bDone[k]]
+                if dead and queue.empty():
+                    failure = 'Worker %d died (exit code %d)' % (dead[0], workers[dead[0]].exitcode)
+                    break
+                continue
+            if kind == 'ship':
+                Nfound += 1
+                ship = sss.parseshipstr(data)
+                sssdb.recordSpeed(foundSpeeds, ship[2:5], ship[0])
+                with sssprof.timed('write.results'):
+                    results.write(data + '\n')
+                print(data, file=sys.stderr)
+            elif kind == 'progress':
+                tested[worker], stats[worker], profiles[worker] = data
+            elif kind == 'done':
+                tested[worker], stats[worker], profiles[worker] = data
+                bDone[worker] = True
+                running -= 1
+            elif kind == 'error':
+                failure = 'Worker %d failed:\n%s' % (worker, data)
+                break
+            curr_time = timer()
+            if curr_time - last_time >= args.update:
+                msg = '%d ships found after testing %d candidate rules out of 2^%d rule space' % \
+                        (Nfound, sum(tested), rulespace)
+                msg += ', %d rules/second' % ((sum(tested) - last_tested) / (curr_time - last_time))
+                print(msg, file=sys.stderr)
+                last_time, last_tested = curr_time, sum(tested)
+                with sssprof.timed('write.results'):
+                    results.flush()
+            if curr_time - checkpoint_time >= args.checkpoint_interval:
+                checkpoint()
+                checkpoint_time = curr_time
+        if failure:
+            for w in workers:
+                w.terminate()
+        else:
+            bComplete = True
+    except KeyboardInterrupt:
+        for w in workers:
+            w.terminate()
+    finally:
+        for w in workers:
+            w.join()
+        if bComplete and args.max_rules is None and not args.tree:
+            matchpatt.removeCheckpoint(args.checkpoint)
+        else:
+            checkpoint()
+    if failure:
+        results.close()
+        g.exit(failure)
+    duration = timer() - start_time
+    totalStats = dict((stage, [0, 0]) for stage in matchpatt.testStages)
+    for workerStats in stats:
+        matchpatt.mergeStats(totalStats, workerStats)
+    report = matchpatt.statsReport(totalStats)
+    print('Test statistics: %s' % report, file=sys.stderr)
+    results.write('# Test statistics: %s\n' % report)
+    results.close()
+    print('%d ships found after testing %d candidate rules in %g s (%d rules/second).' % \
+            (Nfound, sum(tested), duration, sum(tested) / duration), file=sys.stderr)
+    if args.profile:
+        profile = sssprof.snapshot()
+        for workerProfile in profiles:
+            sssprof.merge(profile, workerProfile)
+        info = dict(script='searchRule-parallel.py', pattern=sss.giveRLE(origPatt), rule=origRule,
+                    numgen=args.numgen, seed=args.seed, workers=args.workers, batch=args.batch,
+                    tree=args.tree, equiv=not args.no_equiv, rulesTested=sum(tested),
+                    shipsFound=Nfound, seconds=duration)
+        sssprof.writeReport(args.profile, profile, totalStats, info)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
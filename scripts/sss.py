@@ -4,9 +4,17 @@
 # Includes code from get_all_iso_rules.py, originally by Nathaniel Johnston and Peter Naszvadi
 # by Arie Paap, Oct 2017
 
+import hashlib
 import itertools
 import math
-import golly as g
+import os
+import sssprof
+import sssrle
+try:
+    import golly as g
+except ImportError:
+    # Running outside of Golly, select a headless backend with setBackend()
+    g = None
 
 try:
     # Avoid xrange argument overflowing type C long on Python2
@@ -15,6 +23,31 @@ try:
 except NameError:
     xrange = range
 
+# Simulation backend
+# The routines in this module drive Golly through the scripting API (the
+# module level name g). Any object providing the subset of the Golly API used
+# here can be substituted, e.g. the headless simulator in isosim.py:
+#   import isosim
+#   sss.setBackend(isosim.Headless())
+# Returns the previous backend so that it can be restored.
+def setBackend(backend):
+    global g
+    prev, g = g, backend
+    return prev
+
+def getBackend():
+    return g
+
+# Replace dst with src, atomically where the OS allows it
+def replaceFile(src, dst):
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        # Python 2
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
 # Interpret a pattern in sss format
 # Return a tuple with corresponding fields
 # Format: (minpop, 'rulestr', dx, dy, period, 'shiprle')
@@ -32,18 +65,106 @@ def parseshipstr(shipstr):
     ship[5] = ship[5].strip()
     return tuple(ship)
 
+# Read candidate ships in sss and rle format from lines of text
+# A generator yielding each candidate as a tuple in sss format, ships in rle
+# format (which may span several lines) are given with zero minpop and speed:
+# (0, 'rulestr', 0, 0, 0, 'shiprle'). Unrecognised rle patterns are reported
+# with warn (e.g. g.note) if given.
+def parseCandidates(lines, warn=None):
+    constructRLE = False
+    errormsg = 'Error: failed to recognise rle pattern. Current pattern string:\n'
+    rulestr = ''
+    shiprle = ''
+    for line in lines:
+        line = line.strip()
+        newship = None
+        if constructRLE == False:
+            # Try to import sss format ship
+            newship = parseshipstr(line)
+            if not newship:
+                # Try to import rle format ship
+                if(line[0:4] == 'x = '):
+                    # Found beginning of rle formatted pattern
+                    constructRLE = True
+                    parts = line.split('=')
+                    if len(parts)==4:
+                        rulestr = parts[3].strip()
+                    elif len(parts)==3:
+                        rulestr = 'B3/S23'
+                    else:
+                        constructRLE = False
+                        if warn:
+                            warn(errormsg + line)
+                    shiprle = ''
+        else:
+            # Check for sss format ship (just in case rle recognizer is confused)
+            if parseshipstr(line) and warn:
+                warn(errormsg + rulestr + shiprle + line)
+            # Continue constructing rle pattern string
+            shiprle += line
+            if '!' in line:
+                constructRLE = False
+                newship = (0, rulestr, 0, 0, 0, shiprle)
+        if newship:
+            yield newship
+
+
+# Identity of the current pattern for cycle detection
+# Population, bounding box size and a hash depending only on the relative
+# positions of the cells (g.hash), so any two phases of a periodic pattern
+# which are translations of each other have the same key.
+def phaseKey(r):
+    return (int(g.getpop()), r[2], r[3], g.hash(r))
+
+# Cell lists of the phases of the current pattern over one period, starting
+# with the current phase (the pattern is left in the starting phase, moved by
+# its displacement)
+@sssprof.profiled('cycleCells')
+def cycleCells(period):
+    clists = []
+    for _ in xrange(period):
+        clists.append(g.getcells(g.getrect()))
+        g.run(1)
+    return clists
+
+# Run the current pattern for one period to verify that it is periodic
+# Returns the displacement after one period (None if the pattern does not
+# return to the same phase) and the record of the phases of the cycle,
+# starting with the current phase: (pop, bbox, clist) for each phase. The
+# record gives the minimum population phase, the canonical phase and the
+# minimal rule of a ship without running it again (see testShip).
+@sssprof.profiled('runCycle')
+def runCycle(period):
+    r = g.getrect()
+    phases = []
+    for _ in xrange(period):
+        rr = g.getrect()
+        if not rr:
+            return None, phases
+        phases.append((int(g.getpop()), rr, g.getcells(rr)))
+        g.run(1)
+    rr = g.getrect()
+    if rr and g.transform(phases[0][2], -r[0], -r[1]) == g.transform(g.getcells(rr), -rr[0], -rr[1]):
+        return (rr[0]-r[0], rr[1]-r[1]), phases
+    return None, phases
 
 # Determine the minimum population, displacement and period of a spaceship
 # Input ship is given by an rle string and a separate rule string. If either 
 # string is empty then use the current pattern / rule (respectively).
 # Clears the current layer and leaves the ship in the layer, in a minimum 
 # population phase which has minimum bounding box area.
+# Periodicity is detected when any phase repeats (so ships and oscillators
+# evolving from a predecessor pattern are also found), the repetition is
+# detected by phaseKey() and verified with runCycle().
+# If phases (a list) is given, it is set to the record of the ship's cycle
+# (see runCycle), starting with the phase the ship is left in.
 # XXX True displacement returned - consider returning 5S canonical displacement.
 # XXX Might be better to shift choice of phase to canon5Sship() which also sets
 #     the minimum isotropic rule and adjusts orientation to 5S project standard.
 # XXX Only works in rules with 2 states.
 # --------------------------------------------------------------------
-def testShip(rlepatt, rule, maxgen = 2000):
+@sssprof.profiled('testShip')
+def testShip(rlepatt, rule, maxgen = 2000, phases = None):
     # Clear the layer and place the ship
     r = g.getrect()
     if rlepatt:
@@ -67,9 +188,6 @@ def testShip(rlepatt, rule, maxgen = 2000):
         g.clear(0)
     g.putcells(patt)
     # g.note(str(len(patt)) + ", " + str(patt))
-    # rlepatt might be different to the rle representation determined by
-    # giveRLE(), so ensure we have the correct representation
-    testrle = giveRLE(patt)
     if rule:
         g.setrule(rule)
     speed = ()
@@ -85,8 +203,12 @@ def testShip(rlepatt, rule, maxgen = 2000):
     # Ignore ship if rule is not a 2-state rule
     if not g.numstates()==2:
         return (minpop, speed)
-    for ii in xrange(maxgen):
+    # Generation and position of each phase
+    seen = {phaseKey(bbox): (0, bbox[0], bbox[1])}
+    gen = 0
+    while gen < maxgen:
         g.run(1)
+        gen += 1
         r = g.getrect()
         if not r:
             # Pattern has died out and is therefore not a ship
@@ -98,35 +220,88 @@ def testShip(rlepatt, rule, maxgen = 2000):
             # Find phase with minimimum population
             minpop = pop
             minbboxarea = r[2]*r[3]
-            mingen = ii+1
+            mingen = gen
         elif pop == minpop:
             # Amongst phases with min pop, find one with minimum bbox area
             # bboxarea = r[2]*r[3]
             if bboxarea < minbboxarea:
                 minbboxarea = bboxarea
-                mingen = ii+1
+                mingen = gen
         # Track the bounding box of the pattern's evolution
         maxx = max(maxx, r[2])
         maxy = max(maxy, r[3])
         maxpop = max(maxpop, pop)
-        if (pop == startpop and r[2:4] == bbox[2:4]):
-            if (giveRLE(g.getcells(r)) == testrle):
-                # Starting ship has reappeared
-                speed = (r[0]-bbox[0], r[1]-bbox[1], ii+1) # displacement and period
+        key = phaseKey(r)
+        if key in seen:
+            gen0, x0, y0 = seen[key]
+            period = gen - gen0
+            disp, cycle = runCycle(period)
+            if disp == (r[0]-x0, r[1]-y0):
+                # Pattern has reappeared, find the phase of the cycle with
+                # minimum population (and bbox area) relative to the current
+                # phase
+                speed = disp + (period,) # displacement and period
+                minpop, minbboxarea, mingen = min((pop, rr[2]*rr[3], gen)
+                        for gen, (pop, rr, clist) in enumerate(cycle))
+                if phases is not None:
+                    phases[:] = cycle[mingen:] + cycle[:mingen]
                 break
-        # Check for rotated pattern 
-        elif (pop == startpop and r[2:4] == bbox[3:1:-1]):
-            # For 2-cell oscillators this is sufficient
-            if minpop == 2:
-                speed = (0, 0, 2*(ii+1))
-                mingen = ii+1
+            # Hash collision, runCycle has evolved the pattern for another
+            # period, continue from the current phase
+            mingen = 0
+            for pop, rr, clist in cycle:
+                maxx = max(maxx, rr[2])
+                maxy = max(maxy, rr[3])
+                maxpop = max(maxpop, pop)
+            gen += period
+            r = g.getrect()
+            if not r:
                 break
+            maxx = max(maxx, r[2])
+            maxy = max(maxy, r[3])
+            maxpop = max(maxpop, int(g.getpop()))
+            key = phaseKey(r)
+        seen[key] = (gen, r[0], r[1])
     g.run(mingen) # Evolve ship to generation with minimum population
     # return (minpop, speed)
     # return (minpop, speed, maxpop)
     return (minpop, speed, maxx*maxy)
 # --------------------------------------------------------------------
 
+# Analyse a candidate ship (from parseCandidates)
+# If the ship is in canonical sss format, then analysing it is unnecessary.
+# However, it is worthwhile because not all search scripts analysed ships
+# consistently. Need to analyse new ships anyway if importing them from rle.
+# Returns (ship, msg): the ship in sss format with the minimum population,
+# true displacement and period from testShip() and the rle of the minimum
+# population phase, or None if the ship is rejected with msg explaining why
+# (msg is empty if the ship is silently ignored).
+# If phases (a list) is given, it is set to the record of the ship's cycle
+# starting with the returned phase (see testShip), which can be passed on to
+# canon5Sship.
+@sssprof.profiled('analyseShip')
+def analyseShip(newship, maxgen=2000, phases=None):
+    # Ignore ship if rule string does not have Birth and Survival elements
+    # XXX This may miss some ships where the rule string is non-standard and
+    #     doesn't reject undesired rules like Generations
+    rulestr = newship[1]
+    if not (rulestr[0:1] == 'B' and ('/S' in rulestr or '_S' in rulestr)):
+        sssprof.count('analyseShip.reject.nonIsotropic')
+        return None, 'Ignoring ship in non-isotropic rule.\n%s' % (newship,)
+    # Ignore B0 ships
+    if "B0" in rulestr:
+        sssprof.count('analyseShip.reject.B0')
+        return None, ''
+    try:
+        minpop, speed = testShip(newship[5], rulestr, maxgen, phases)[0:2]
+    except RuntimeError:
+        sssprof.count('analyseShip.reject.error')
+        return None, "Error processing newship, check rule validity:\n" + str(newship)
+    if not speed:
+        sssprof.count('analyseShip.reject.noSpeed')
+        return None, 'Ship analysis error: speed is empty.\n%s, %s, %s' % (minpop, speed, newship)
+    return (minpop, rulestr)+speed+(giveRLE(g.getcells(g.getrect())),), ''
+
 
 # Return the minimum and maximum of the absolute value of a list of numbers
 def minmaxofabs(v):
@@ -136,36 +311,70 @@ def minmaxofabs(v):
 # Define a sign function
 sign = lambda x: int(math.copysign(1, x))
 
+# Symmetries of the square grid as transformation matrices (axx, axy, ayx, ayy)
+# in the argument order of g.transform
+symmetries = [(1, 0, 0, 1), (0, -1, 1, 0), (-1, 0, 0, -1), (0, 1, -1, 0),
+              (-1, 0, 0, 1), (1, 0, 0, -1), (0, 1, 1, 0), (0, -1, -1, 0)]
+
 # Find the canonical pattern for a sss format ship
 # This is determined by orienting the ship so that it travels E, SE, or ESE,
 # setting the rule to the minimal isotropic rule which supports the ship, and
 # choosing a minimal bounding box phase from all phases with minimal population
 # Input ship is in sss format: (minpop, 'rulestr', dx, dy, period, 'shiprle')
-# XXX Two cases where the resulting pattern is not guaranteed to be canonical:
-#   - asymmetrical ships travelling orthogonally or diagonally (either one of
-#     the two orientations in the canonical direction may be returned)
-#   - multiple phases having the minimal population and bounding box area
-def canon5Sship(ship, maxgen=2000):
+# with the true displacement of the ship (as given by testShip()).
+# Every orientation which transforms the displacement to the canonical
+# direction (two for orthogonal and diagonal ships) is applied to every phase
+# with minimal population and bounding box area, and the canonical ship is the
+# one with the smallest key (len(rle), rle), so the result does not depend on
+# the phase or orientation of the input ship. Leaves the canonical ship in the
+# layer.
+# The phases of the ship are taken from the record of its cycle (phases, see
+# analyseShip) if it is given, otherwise the ship is run for one period.
+@sssprof.profiled('canon5Sship')
+def canon5Sship(ship, maxgen=2000, phases=None):
     minpop, rulestr, dx, dy, period, shiprle = ship
     shipPatt = g.parse(shiprle)
-    # Transform ship to canonical direction
-    if abs(dx) >= abs(dy):
-        a, b, c, d = sign(dx), 0, 0, sign(dy)
-    else:
-        a, b, c, d = 0, sign(dy), sign(dx), 0
-    dy, dx = minmaxofabs((dx, dy))
-    shipPatt = g.transform(shipPatt, 0, 0, a, b, c, d)
     # Clear the layer and place the ship
     r = g.getrect()
     if r:
         g.select(r)
         g.clear(0)
     g.putcells(shipPatt)
-    shiprle = giveRLE(g.getcells(g.getrect()))
     g.setrule(rulestr)
-    # Determine the minimal isotropic rule
-    setminisorule(period)
-    return minpop, g.getrule(), dx, dy, period, shiprle
+    # The phases of one period give both the minimal isotropic rule and the
+    # phases with minimal population and bounding box area
+    if phases and len(phases) == period:
+        phases = [(pop, r[2]*r[3], clist) for pop, r, clist in phases]
+    else:
+        phases = []
+        for gen in xrange(max(period, 1)):
+            r = g.getrect()
+            phases.append((int(g.getpop()), r[2]*r[3], g.getcells(r)))
+            g.run(1)
+    setminisorule(period, [clist for pop, area, clist in phases])
+    rulestr = g.getrule()
+    minpop, minarea = min(phase[0:2] for phase in phases)
+    # Transform ship to canonical direction
+    dy, dx = minmaxofabs((dx, dy))
+    orientations = [T for T in symmetries
+                    if (T[0]*ship[2] + T[1]*ship[3], T[2]*ship[2] + T[3]*ship[3]) == (dx, dy)]
+    shiprle = min((giveRLE(g.transform(clist, 0, 0, *T))
+                   for pop, area, clist in phases if (pop, area) == (minpop, minarea)
+                   for T in orientations), key=lambda rle: (len(rle), rle))
+    # Place the canonical ship in the layer
+    g.select(g.getrect())
+    g.clear(0)
+    g.putcells(g.parse(shiprle))
+    return minpop, rulestr, dx, dy, period, shiprle
+
+# Stable content hash of a ship in sss format
+# For canonical ships (from canon5Sship) identical ships have the same hash,
+# whatever the phase, orientation or rule they were found in, so the hash can
+# be used to find duplicate ships across files and runs.
+def shipHash(ship):
+    minpop, rulestr, dx, dy, period, shiprle = ship
+    desc = '%s %s %d %d %d' % (shiprle, rulestr, dx, dy, period)
+    return hashlib.sha1(desc.encode()).hexdigest()
     
 
 # Python function to convert a cell list to RLE
@@ -174,53 +383,16 @@ def canon5Sship(ship, maxgen=2000):
 #         No error checking added.
 #         TBD:  check for multistate rule, show appropriate warning.
 #    AJP: Replace g.evolve(clist,0) with Python sort (faster for small patterns)
+#         Encoder moved to sssrle.py
 # --------------------------------------------------------------------
 def chunks(l, n):
     for i in range(0, len(l), n):
         yield l[i:i+n]
 
+# Runs are found over the sorted cell coordinates and the RLE pieces joined
+# once (see sssrle.encode), giving the same RLE as the original giveRLE.
 def giveRLE(clist):
-    # clist_chunks = list (chunks (g.evolve(clist,0), 2))
-    clist_chunks = list(chunks(clist, 2))
-    clist_chunks.sort(key=lambda l:(l[1], l[0]))
-    mcc = min(clist_chunks)
-    rl_list = [[x[0]-mcc[0],x[1]-mcc[1]] for x in clist_chunks]
-    rle_res = ""
-    rle_len = 1
-    rl_y = rl_list[0][1] - 1
-    rl_x = 0
-    for rl_i in rl_list:
-        if rl_i[1] == rl_y:
-            if rl_i[0] == rl_x + 1:
-                rle_len += 1
-            else:
-                if rle_len == 1: rle_strA = ""
-                else: rle_strA = str (rle_len)
-                if rl_i[0] - rl_x - 1 == 1: rle_strB = ""
-                else: rle_strB = str (rl_i[0] - rl_x - 1)
-                
-                rle_res = rle_res + rle_strA + "o" + rle_strB + "b"
-                rle_len = 1
-        else:
-            if rle_len == 1: rle_strA = ""
-            else: rle_strA = str (rle_len)
-            if rl_i[1] - rl_y == 1: rle_strB = ""
-            else: rle_strB = str (rl_i[1] - rl_y)
-            if rl_i[0] == 1: rle_strC = "b"
-            elif rl_i[0] == 0: rle_strC = ""
-            else: rle_strC = str (rl_i[0]) + "b"
-            
-            rle_res = rle_res + rle_strA + "o" + rle_strB + "$" + rle_strC
-            rle_len = 1
-            
-        rl_x = rl_i[0]
-        rl_y = rl_i[1]
-    
-    if rle_len == 1: rle_strA = ""
-    else: rle_strA = str (rle_len)
-    rle_res = rle_res[2:] + rle_strA + "o"
-    
-    return rle_res+"!"
+    return sssrle.encode(clist)
 # --------------------------------------------------------------------
 
 # Isotropic rule range functions
@@ -235,6 +407,12 @@ def giveRLE(clist):
 #       evolution remains unchanged for a given number of generations.
 #       Returns the required and allowed isotropic rule transitions in four lists.
 #       Optionally compute only the minimum or the maximum rule.
+#       The cell lists of the pattern's phases can be given when they are
+#       already known (e.g. from cycleCells), the pattern is then not simulated.
+#   - usedTransitions:
+#       Determines the isotropic transitions which occur in the evolution of
+#       a pattern. Used by getRuleRangeElems to find the rule range directly
+#       from the neighbourhoods present in each generation.
 # --------------------------------------------------------------------
 
 Hensel = [
@@ -249,6 +427,49 @@ Hensel = [
     ['8']
 ]
 
+# All isotropic transitions in Hensel order
+transList = [t for l in Hensel for t in l]
+transIndex = dict((t, i) for i, t in enumerate(transList))
+
+# Representative neighbourhoods of the isotropic transitions
+# A 3x3 neighbourhood is encoded as a 9-bit integer with the cells numbered in
+# reading order, so that bit 4 is the centre cell:
+#   0 1 2
+#   3 4 5
+#   6 7 8
+# Transitions with more than 4 neighbours are the complement of the transition
+# with the same letter and 8-n neighbours.
+HenselNbhd = {
+    '0': 0,
+    '1c': 1, '1e': 2,
+    '2a': 3, '2c': 5, '2e': 10, '2i': 40, '2k': 33, '2n': 68,
+    '3a': 11, '3c': 69, '3e': 42, '3i': 7, '3j': 14, '3k': 98, '3n': 13,
+    '3q': 70, '3r': 41, '3y': 97,
+    '4a': 15, '4c': 325, '4e': 170, '4i': 45, '4j': 106, '4k': 99, '4n': 71,
+    '4q': 102, '4r': 43, '4t': 105, '4w': 78, '4y': 101, '4z': 108
+}
+
+# Lookup table from encoded neighbourhood (0-511) to isotropic transition
+# The state of the centre cell is ignored.
+def getNbhdTrans():
+    coords = [(i % 3 - 1, i // 3 - 1) for i in range(9)]
+    nbhdTrans = [''] * 512
+    for t in transList:
+        n = int(t[0])
+        if n > 4:
+            nbhd = 495 ^ HenselNbhd[str(8-n) + t[1:]]
+        else:
+            nbhd = HenselNbhd[t]
+        for (a, b, c, d) in symmetries:
+            m = 0
+            for i, (x, y) in enumerate(coords):
+                if nbhd & (1 << i):
+                    m |= 1 << coords.index((a*x + b*y, c*x + d*y))
+            nbhdTrans[m] = nbhdTrans[m | 16] = t
+    return nbhdTrans
+
+nbhdTrans = getNbhdTrans()
+
 def parseTransitions(ruleTrans):
     ruleElem = []
     if not ruleTrans:
@@ -301,7 +522,153 @@ def rulestringopt(a):
     result = result.replace('7ce', '7')
     return result
 
-def getRuleRangeElems(period, ruleRange = 'minmax'):
+# Transitions which occur in the given generations of a pattern
+# Input is a list of cell lists. Returns the sets of birth and survival
+# transitions applied to the cells of each generation to find the next one.
+# Only neighbourhoods which contain a live cell are found explicitly, birth on
+# zero neighbours occurs in every generation.
+def usedTransitions(clists):
+    bUsed, sUsed = set(['0']), set()
+    offsets = [(i % 3 - 1, i // 3 - 1) for i in range(9)]
+    for clist in clists:
+        nbhds = {}
+        for x, y in zip(clist[::2], clist[1::2]):
+            for bit, (dx, dy) in enumerate(offsets):
+                cell = (x - dx, y - dy)
+                nbhds[cell] = nbhds.get(cell, 0) | (1 << bit)
+        for nbhd in nbhds.values():
+            if nbhd & 16:
+                sUsed.add(nbhdTrans[nbhd])
+            else:
+                bUsed.add(nbhdTrans[nbhd])
+    return bUsed, sUsed
+
+# Isotropic rule represented by two transition bitmasks
+# Bit i of b (s) is set if transition transList[i] is a birth (survival)
+# transition of the rule. Rules support bitwise operations, e.g. for a rule
+# range given by the rules need and OK:
+#   need <= rule <= OK    (rule is in the range)
+#   OK - need             (optional transitions)
+#   need | IsoRule(...)   (union of transitions)
+# The rule string (in canonical form) is only created when it is needed.
+# --------------------------------------------------------------------
+
+# Canonical rule string in the same style as Golly
+# Transitions for each neighbour count are listed in Golly's letter order,
+# using the negated form when more than half of the transitions are present.
+ruleLetters = 'ceaiknjqrytwz'
+def canonRule(bTrans, sTrans):
+    def transStr(trans):
+        res = ''
+        for n, tList in enumerate(Hensel):
+            present = [t[1:] for t in tList if t in trans]
+            if not present:
+                continue
+            if len(present) == len(tList):
+                res += str(n)
+                continue
+            missing = [t[1:] for t in tList if t not in trans]
+            if len(present) > len(missing):
+                res += str(n) + '-' + ''.join(sorted(missing, key=ruleLetters.index))
+            else:
+                res += str(n) + ''.join(sorted(present, key=ruleLetters.index))
+        return res
+    return 'B' + transStr(set(bTrans)) + '/S' + transStr(set(sTrans))
+
+def transMask(tList):
+    mask = 0
+    for t in tList:
+        mask |= 1 << transIndex[t]
+    return mask
+
+def maskTrans(mask):
+    return [t for i, t in enumerate(transList) if mask >> i & 1]
+
+class IsoRule(object):
+    __slots__ = ('b', 's', 'rulestr')
+    
+    def __init__(self, b=0, s=0):
+        self.b = b
+        self.s = s
+        self.rulestr = None
+    
+    @classmethod
+    def fromTrans(cls, bTrans, sTrans):
+        return cls(transMask(bTrans), transMask(sTrans))
+    
+    # Parse an isotropic rule string, raises ValueError if the rule is invalid
+    @classmethod
+    def fromString(cls, rulestr):
+        rule = rulestr.split(':')[0].strip()
+        try:
+            Bstr, Sstr = rule.replace('_', '/').split('/')
+            if not (Bstr[0] in 'Bb' and Sstr[0] in 'Ss'):
+                raise ValueError
+            return cls.fromTrans(parseTransitions(Bstr[1:]), parseTransitions(Sstr[1:]))
+        except (ValueError, IndexError, KeyError):
+            raise ValueError('Invalid isotropic rule: %s' % rulestr)
+    
+    def bTrans(self):
+        return maskTrans(self.b)
+    
+    def sTrans(self):
+        return maskTrans(self.s)
+    
+    def __str__(self):
+        if self.rulestr is None:
+            self.rulestr = canonRule(self.bTrans(), self.sTrans())
+        return self.rulestr
+    
+    def __repr__(self):
+        return 'IsoRule(%s)' % self
+    
+    def __eq__(self, other):
+        return self.b == other.b and self.s == other.s
+    
+    def __ne__(self, other):
+        return not self == other
+    
+    def __hash__(self):
+        return hash((self.b, self.s))
+    
+    # Subset of transitions
+    def __le__(self, other):
+        return (self.b & ~other.b) == 0 and (self.s & ~other.s) == 0
+    
+    def __ge__(self, other):
+        return other <= self
+    
+    def __and__(self, other):
+        return IsoRule(self.b & other.b, self.s & other.s)
+    
+    def __or__(self, other):
+        return IsoRule(self.b | other.b, self.s | other.s)
+    
+    def __xor__(self, other):
+        return IsoRule(self.b ^ other.b, self.s ^ other.s)
+    
+    def __sub__(self, other):
+        return IsoRule(self.b & ~other.b, self.s & ~other.s)
+
+# --------------------------------------------------------------------
+
+# The rule range can be found with two methods:
+#   - 'table': find the transitions used in the pattern's evolution in the
+#       current rule. A transition of the current rule is required if and only
+#       if it is used, and any unused transition is allowed. Only simulates the
+#       pattern once.
+#   - 'brute': remove each rule transition in turn (add each unused transition)
+#       and re-simulate the pattern to test if its evolution is unchanged.
+#   - 'check': use both methods and exit with an error if the results differ.
+@sssprof.profiled('getRuleRangeElems')
+def getRuleRangeElems(period, ruleRange = 'minmax', method = 'table', clists = None):
+    if method == 'check':
+        tableRange = getRuleRangeElems(period, ruleRange, 'table', clists)
+        bruteRange = getRuleRangeElems(period, ruleRange, 'brute')
+        if not tableRange == bruteRange:
+            g.exit('Rule range mismatch:\ntable: %s\nbrute: %s' % (tableRange, bruteRange))
+        return tableRange
+    
     if g.empty():
         return
     if period < 1:
@@ -324,14 +691,29 @@ def getRuleRangeElems(period, ruleRange = 'minmax'):
     
     patt = g.getcells(g.getrect())
     
-    # Record behavior of pattern in current rule
-    clist = []
-    poplist = []
-    for i in range(0,period):
-        g.run(1)
-        clist.append(g.getcells(g.getrect()))
-        poplist.append(g.getpop())
-    finalpop = g.getpop()
+    if clists and method == 'table':
+        # Phases of the pattern already recorded (e.g. by cycleCells)
+        phases = clists
+    else:
+        # Record behavior of pattern in current rule
+        clist = []
+        poplist = []
+        for i in range(0,period):
+            g.run(1)
+            clist.append(g.getcells(g.getrect()))
+            poplist.append(g.getpop())
+        finalpop = g.getpop()
+        phases = [patt] + clist[:-1]
+    
+    if method == 'table':
+        bUsed, sUsed = usedTransitions(phases)
+        if 'min' in ruleRange:
+            b_need = sorted(t for t in b_need if t in bUsed)
+            s_need = sorted(t for t in s_need if t in sUsed)
+        if 'max' in ruleRange:
+            b_OK = sorted(set(b_OK) | set(t for t in transList if not t in bUsed))
+            s_OK = sorted(set(s_OK) | set(t for t in transList if not t in sUsed))
+        ruleRange = ''
     
     if 'min' in ruleRange:
         # Test all rule transitions to determine if they are required
@@ -378,7 +760,8 @@ def getRuleRangeElems(period, ruleRange = 'minmax'):
         allRuleElem = [t for l in Hensel for t in l]
         
         for t in allRuleElem:
-            if t in b_OK:
+            # B0 is never allowed, every empty cell would be born
+            if t in b_OK or t == '0':
                 continue
             b_OK.append(t)
             g.setrule('B' + ''.join(b_OK) + '/S' + Sstr)
@@ -428,13 +811,14 @@ def getRuleRangeElems(period, ruleRange = 'minmax'):
     
     return b_need, s_need, b_OK, s_OK
 
-def setminisorule(period):
+@sssprof.profiled('setminisorule')
+def setminisorule(period, clists = None):
     if g.empty():
         return
     if period < 1:
         return
     
-    b_need, s_need, b_OK, s_OK = getRuleRangeElems(period, ruleRange = 'min')
+    b_need, s_need, b_OK, s_OK = getRuleRangeElems(period, ruleRange = 'min', clists = clists)
     
     minrulestr = 'B' + ''.join(sorted(b_need)) + '/S' + ''.join(sorted(s_need))
     g.setrule(minrulestr)
@@ -450,33 +834,107 @@ def setminisorule(period):
 #   S_need - the required Survival transitions
 #   B_OK - the optional Birth transitions
 #   S_OK - the optional Survival transitions
+# iterRule() iterates over the same sequence of rules as IsoRule objects,
+# which is much faster than creating the rule strings (use setrule() to set
+# the backend's rule).
 # Provide a value to seed to specify the starting point of the generator
 #   seed < 2^(len(B_OK) + len(S_OK))
+# The iterator state can be saved and restored to resume an interrupted search:
+#   state = rules.getState()
+#   rules = iterRuleStr(**state)
+# where state['index'] is the number of rules already returned.
+# Random access to the sequence of rules uses an O(log N) jump ahead of the LCG:
+#   rules.ruleAt(index) - the rule at the given index of the sequence
+#   rules.slice(start, stop, step) - generator over rules start, start+step, ...
+# e.g. worker k of N can test rules.slice(k, None, N)
 # --------------------------------------------------------------------
 
-def iterRuleStr(B_OK, S_OK, B_need=[], S_need=[], seed=1):
-    # Pseudo-random rule index generator using an LCG
-    def randRuleIdx(nB_OK, nS_OK, seed=1):
+def iterRuleStr(B_OK, S_OK, B_need=[], S_need=[], seed=1, index=0):
+    return RuleStrIter(B_OK, S_OK, B_need, S_need, seed, index)
+
+def iterRule(B_OK, S_OK, B_need=[], S_need=[], seed=1, index=0):
+    return RuleIter(B_OK, S_OK, B_need, S_need, seed, index)
+
+class RuleStrIter(object):
+    # LCG parameters (modulus is the size of the rule space)
+    a = 5
+    c = 7
+    
+    def __init__(self, B_OK, S_OK, B_need=[], S_need=[], seed=1, index=0):
+        self.B_OK, self.S_OK = list(B_OK), list(S_OK)
+        self.B_need, self.S_need = list(B_need), list(S_need)
+        self.seed = seed
+        self.nS_OK = len(self.S_OK)
+        self.m = 2**(len(self.B_OK) + self.nS_OK)
+        # Masks for birth and survival transitions
+        self.maskS = 2**self.nS_OK - 1
+        self.maskB = (2**len(self.B_OK) - 1) << self.nS_OK
+        self.Bstr = 'B' + ''.join(self.B_need)
+        self.Sstr = '/S' + ''.join(self.S_need)
         # LCG state initialisation
-        m = 2**(nB_OK + nS_OK)
-        c = 7
-        a = 5
         # Reduce collisions for small seed values
+        self.state = seed
         for _ in range(3):
-            seed = (a*seed+c) % m
-        
-        # Masks for birth and survival transitions
-        maskS = 2**nS_OK - 1
-        maskB = (2**nB_OK - 1) << nS_OK
-        
-        for ii in xrange(m):
-            seed = (a*seed+c) % m
-            randS = seed & maskS
-            randB = (seed & maskB) >> nS_OK
-            yield (randB, randS)
+            self.advance()
+        self.state0 = self.state
+        self.index = index
+        self.state = self.jump(self.state0, index)
+    
+    def advance(self):
+        self.state = (self.a*self.state+self.c) % self.m
+    
+    # Coefficients (A, C) of n steps of the LCG: x -> A*x + C (mod m)
+    # Computed by repeated squaring of the affine map x -> a*x + c
+    def jumpCoeffs(self, n):
+        A, C = 1, 0
+        a, c = self.a % self.m, self.c % self.m
+        while n > 0:
+            if n & 1:
+                A, C = (a*A) % self.m, (a*C + c) % self.m
+            a, c = (a*a) % self.m, (a*c + c) % self.m
+            n >>= 1
+        return A, C
+    
+    # LCG state n steps after the given state
+    def jump(self, state, n):
+        A, C = self.jumpCoeffs(n)
+        return (A*state + C) % self.m
+    
+    # Rule string for a given LCG state
+    def getRuleStr(self, state):
+        randS = state & self.maskS
+        randB = (state & self.maskB) >> self.nS_OK
+        return self.Bstr + self.getTransStr(self.B_OK, randB) + self.Sstr + self.getTransStr(self.S_OK, randS)
+    
+    getRule = getRuleStr
+    
+    # Rule at the given index of the sequence (the first rule has index 0)
+    def ruleAt(self, index):
+        if not 0 <= index < self.m:
+            raise IndexError('Rule index out of range: %d' % index)
+        return self.getRule(self.jump(self.state0, index+1))
+    
+    # Generator over the rules with index start, start+step, ... < stop
+    # Does not change the iterator's own state
+    def slice(self, start, stop=None, step=1):
+        if step < 1:
+            raise ValueError('Rule slice step must be at least 1')
+        if stop is None or stop > self.m:
+            stop = self.m
+        if start >= stop:
+            return
+        state = self.jump(self.state0, start+1)
+        A, C = self.jumpCoeffs(step)
+        for _ in xrange((stop - start - 1) // step + 1):
+            yield self.getRule(state)
+            state = (A*state + C) % self.m
+    
+    def getState(self):
+        return dict(B_OK=list(self.B_OK), S_OK=list(self.S_OK), B_need=list(self.B_need),
+                    S_need=list(self.S_need), seed=self.seed, index=self.index)
     
     # Transition String retrieval
-    def getTransStr(tList, idx):
+    def getTransStr(self, tList, idx):
         trans = ''
         for t in tList:
             if (idx & 1):
@@ -484,11 +942,58 @@ def iterRuleStr(B_OK, S_OK, B_need=[], S_need=[], seed=1):
             idx = idx >> 1
         return trans
     
-    Bstr = 'B' + ''.join(B_need)
-    Sstr = '/S' + ''.join(S_need)
+    def __iter__(self):
+        return self
     
-    for (Bidx, Sidx) in randRuleIdx(len(B_OK), len(S_OK), seed):
-        rulestr = Bstr + getTransStr(B_OK, Bidx) + Sstr + getTransStr(S_OK, Sidx)
-        yield rulestr
+    def __next__(self):
+        if self.index >= self.m:
+            raise StopIteration
+        self.advance()
+        self.index += 1
+        return self.getRule(self.state)
+    
+    next = __next__ # Python 2
+
+# Rule iterator returning IsoRule objects
+# The optional transitions selected by the LCG state are mapped to transition
+# bitmasks one byte at a time using lookup tables.
+class RuleIter(RuleStrIter):
+    def __init__(self, B_OK, S_OK, B_need=[], S_need=[], seed=1, index=0):
+        RuleStrIter.__init__(self, B_OK, S_OK, B_need, S_need, seed, index)
+        self.bNeed = transMask(self.B_need)
+        self.sNeed = transMask(self.S_need)
+        self.bTables = self.depositTables(self.B_OK)
+        self.sTables = self.depositTables(self.S_OK)
+    
+    # tables[k][byte] is the bitmask of the transitions selected by byte k
+    def depositTables(self, tList):
+        tables = []
+        for k in range(0, len(tList), 8):
+            masks = [1 << transIndex[t] for t in tList[k:k+8]]
+            tables.append([sum(m for j, m in enumerate(masks) if byte >> j & 1)
+                           for byte in range(2**len(masks))])
+        return tables
+    
+    def getRule(self, state):
+        randS = state & self.maskS
+        randB = state >> self.nS_OK
+        b, s = self.bNeed, self.sNeed
+        for table in self.bTables:
+            b |= table[randB & 255]
+            randB >>= 8
+        for table in self.sTables:
+            s |= table[randS & 255]
+            randS >>= 8
+        return IsoRule(b, s)
+
+# Set the backend's rule from a rule string or IsoRule
+# Backends which support IsoRule objects directly provide g.setisorule()
+def setrule(rule):
+    if isinstance(rule, IsoRule):
+        if hasattr(g, 'setisorule'):
+            g.setisorule(rule)
+            return
+        rule = str(rule)
+    g.setrule(rule)
 
 # --------------------------------------------------------------------
@@ -2,10 +2,10 @@
 # Golly Python script to peview patterns in sss format
 # Author: Arie Paap
 
-import re
 import time
 from timeit import default_timer as timer 
 import golly as g
+import sssio
 
 # Check if pattern is in view and shift view / resize if necessary
 def checkFit():
@@ -17,29 +17,23 @@ def checkFit():
     if not g.visrect(r):
       g.setmag(g.getmag()-1)
 
-# regex for sss format ships
-sssFormat = re.compile(r'(\d+), (B[0-9aceijknqrtwyz-]+/S[0-9aceijknqrtwyz-]*), (\d+), (\d+), (\d+), ([0-9ob$]+!)')
-
-sssPatterns = []
 filetypes = "sss Files (*.sss.txt;*.txt)|*.sss.txt;*.txt"
 sssFile = g.opendialog("Choose spaceship file", filetypes)
 
-# Grab a string containing all the sss format patterns
+# Read the sss format patterns lazily (see sssio.py), large files are not
+# loaded into memory. Only the patterns shown so far are kept (to go back).
+# Format: (minpop, 'rulestr', dx, dy, period, 'shiprle')
 if sssFile:
-  with open(sssFile, 'r') as F:
-    sssFileLines = F.readlines()
+  Npatts = sum(1 for ship in sssio.readFile(sssFile))
+  sssShips = sssio.readFile(sssFile)
 else:
   sssFileLines = g.getclipstr().splitlines()
-
-for line in sssFileLines:
-  m = sssFormat.match(line)
-  if m:
-    # Format: (minpop, 'rulestr', dx, dy, period, 'shiprle')
-    s = m.groups()
-    sssPatterns.append((int(s[0]), s[1], int(s[2]), int(s[3]), int(s[4]), s[5]))
+  Npatts = sum(1 for ship in sssio.readShips(sssFileLines))
+  sssShips = sssio.readShips(sssFileLines)
+sssPatterns = []
 
 g.new('sss Patterns')
-g.show('%d patterns imported' % len(sssPatterns))
+g.show('%d patterns imported' % Npatts)
 
 # For frame rate and timing
 frameRate = 100
@@ -48,8 +42,9 @@ framePeriod = 1.0/frameRate
 sleepTime = 0.001
 
 N = 0
-Npatts = len(sssPatterns)
 while N < Npatts:
+  if N == len(sssPatterns):
+    sssPatterns.append(next(sssShips))
   ship = sssPatterns[N]
   r = g.getrect()
   if r:
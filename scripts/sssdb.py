@@ -0,0 +1,480 @@
+# sssdb.py
+# Indexed store for the 5S spaceship collections
+# The ships of all three collections are kept in an SQLite database, one row
+# per speed, keyed by the canonical displacement and period (dx, dy, period)
+# with dx >= dy >= 0. Lookups go through the primary key index (with the
+# database memory mapped), and updates are incremental upserts, so the cost of
+# looking up or updating a speed does not depend on the size of the
+# collection.
+#
+# The sss text files are an import / export format. A collection is imported
+# from its sss file with sync() when the file has changed since it was last
+# imported or exported (by modification time and size), so when the store is
+# up to date nothing is read at startup. exportSSS() writes a collection in
+# the standard order (period, then decreasing dx, then decreasing dy), with
+# the header (comment lines) of the imported file.
+#
+# The canonical form of ships (canonical orientation and rle, minimal
+# isotropic rule and bounding box area, see canonShip) is cached in the store
+# the first time it is computed, keyed by a hash of the ship's rle, rule and
+# speed (shipKey), so canonising a ship which has been seen before is a lookup.
+#   import sssdb
+#   store = sssdb.ShipStore()
+#   store.sync('o', 'Orthogonal ships.sss.txt')
+#   ship = store.get((2, 0, 4))  # (minpop, rulestr, dx, dy, period, shiprle)
+
+import os
+import sqlite3
+import sss
+import sssrle
+
+# Default store file (in the 5S project directory)
+storeFile = '5S ships.sqlite'
+# Default known speeds file shared by concurrent searches (see SharedSpeeds)
+speedsFile = 'Known speeds.sqlite'
+
+collectionNames = {'o': 'orthogonal', 'd': 'diagonal', 'k': 'oblique'}
+collectionFiles = {'o': 'Orthogonal ships.sss.txt', 'd': 'Diagonal ships.sss.txt',
+                   'k': 'Oblique ships.sss.txt'}
+
+# Collection of a spaceship with the given displacement
+# Returns 'o' (orthogonal), 'd' (diagonal) or 'k' (oblique), and '' for
+# oscillators.
+def shipType(dx, dy):
+    dy, dx = sss.minmaxofabs((dx, dy))
+    if dx == 0:
+        return ''
+    if dy == 0:
+        return 'o'
+    if dy == dx:
+        return 'd'
+    return 'k'
+
+# Bounding box area of a pattern given as rle
+def bboxArea(shiprle):
+    clist = sssrle.decode(shiprle)
+    if not clist:
+        return 0
+    xs, ys = clist[0::2], clist[1::2]
+    return (max(xs) - min(xs) + 1) * (max(ys) - min(ys) + 1)
+
+# Hash identifying a ship in sss format by its rle, rule and speed
+shipKey = sss.shipHash
+
+schema = '''
+CREATE TABLE IF NOT EXISTS ships (
+    dx INTEGER NOT NULL,
+    dy INTEGER NOT NULL,
+    period INTEGER NOT NULL,
+    minpop INTEGER NOT NULL,
+    rule TEXT NOT NULL,
+    rle TEXT NOT NULL,
+    bbox INTEGER NOT NULL,
+    collection TEXT NOT NULL,
+    PRIMARY KEY (dx, dy, period)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS shipsByCollection ON ships (collection, period, dx, dy);
+CREATE TABLE IF NOT EXISTS canon (
+    key TEXT PRIMARY KEY,
+    rule TEXT NOT NULL,
+    rle TEXT NOT NULL,
+    bbox INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS collections (
+    collection TEXT PRIMARY KEY,
+    header TEXT NOT NULL,
+    fileName TEXT,
+    mtime REAL,
+    size INTEGER
+);
+'''
+
+shipColumns = 'minpop, rule, dx, dy, period, rle'
+
+class ShipStore(object):
+    # Size of the memory mapped part of the database file (bytes)
+    mmapSize = 1 << 28
+
+    def __init__(self, fileName=storeFile):
+        self.fileName = fileName
+        self.db = sqlite3.connect(fileName)
+        self.db.execute('PRAGMA mmap_size = %d' % self.mmapSize)
+        self.db.executescript(schema)
+
+    def close(self):
+        self.db.close()
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        if excType is None:
+            self.commit()
+        self.close()
+
+    # Lookups
+    # speed is the canonical (dx, dy, period)
+    def get(self, speed):
+        row = self.db.execute('SELECT %s FROM ships WHERE dx = ? AND dy = ? AND period = ?' % \
+                              shipColumns, tuple(speed)).fetchone()
+        return tuple(row) if row else None
+
+    def minpop(self, speed):
+        row = self.db.execute('SELECT minpop FROM ships WHERE dx = ? AND dy = ? AND period = ?',
+                              tuple(speed)).fetchone()
+        return row[0] if row else None
+
+    def bbox(self, speed):
+        row = self.db.execute('SELECT bbox FROM ships WHERE dx = ? AND dy = ? AND period = ?',
+                              tuple(speed)).fetchone()
+        return row[0] if row else None
+
+    def __contains__(self, speed):
+        return self.minpop(speed) is not None
+
+    # Minimum population of every speed in the store, as a dictionary (an
+    # in-memory index for bulk lookups)
+    def speedIndex(self):
+        return dict(((dx, dy, period), minpop) for dx, dy, period, minpop in
+                    self.db.execute('SELECT dx, dy, period, minpop FROM ships'))
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM ships').fetchone()[0]
+
+    # Ships in a collection (or all ships) in sss file order
+    def ships(self, collection=None):
+        query = 'SELECT %s FROM ships' % shipColumns
+        args = ()
+        if collection:
+            query += ' WHERE collection = ?'
+            args = (collection,)
+        query += ' ORDER BY period, dx DESC, dy DESC'
+        for row in self.db.execute(query, args):
+            yield tuple(row)
+
+    # Updates
+    # Add or replace the ship for its speed. The ship is in sss format with
+    # canonical speed, the bounding box area is calculated if not given.
+    # Changes are made in a transaction, finish with commit() or rollback().
+    def put(self, ship, bbox=None):
+        minpop, rulestr, dx, dy, period, shiprle = ship
+        if bbox is None:
+            bbox = bboxArea(shiprle)
+        self.db.execute('INSERT OR REPLACE INTO ships VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (dx, dy, period, minpop, rulestr, shiprle, bbox, shipType(dx, dy)))
+
+    # Canonical form cache
+    # Returns (rulestr, shiprle, bbox) of the canonical form of the ship with
+    # the given key (from shipKey), or None if it is not cached.
+    def getCanon(self, key):
+        row = self.db.execute('SELECT rule, rle, bbox FROM canon WHERE key = ?',
+                              (key,)).fetchone()
+        return tuple(row) if row else None
+
+    def putCanon(self, key, rulestr, shiprle, bbox):
+        self.db.execute('INSERT OR REPLACE INTO canon VALUES (?, ?, ?, ?)',
+                        (key, rulestr, shiprle, bbox))
+
+    def header(self, collection):
+        row = self.db.execute('SELECT header FROM collections WHERE collection = ?',
+                              (collection,)).fetchone()
+        return row[0] if row else ''
+
+    # Record the state of the sss file which is in sync with the collection
+    def recordFile(self, collection, fileName, header=None):
+        if header is None:
+            header = self.header(collection)
+        st = os.stat(fileName)
+        self.db.execute('INSERT OR REPLACE INTO collections VALUES (?, ?, ?, ?, ?)',
+                        (collection, header, os.path.abspath(fileName), st.st_mtime, st.st_size))
+
+    # Returns True if the sss file has not changed since it was last imported
+    # to or exported from the collection
+    def isCurrent(self, collection, fileName):
+        row = self.db.execute('SELECT fileName, mtime, size FROM collections WHERE collection = ?',
+                              (collection,)).fetchone()
+        if not row:
+            return False
+        st = os.stat(fileName)
+        return row == (os.path.abspath(fileName), st.st_mtime, st.st_size)
+
+    # Replace a collection with the ships in an sss file
+    # Lines which are not ships are kept as the collection's header (lines
+    # which are not empty or comments are also returned so that they can be
+    # reported). Returns (number of ships, ignored lines).
+    def importSSS(self, collection, fileName):
+        header = ''
+        ignored = []
+        N = 0
+        self.db.execute('DELETE FROM ships WHERE collection = ?', (collection,))
+        with open(fileName) as fIn:
+            for line in fIn:
+                # Trust the data in the sss file, no need to test ships
+                ship = sss.parseshipstr(line)
+                if not ship:
+                    if (line.strip() and (not line[0] == '#')):
+                        ignored.append(line)
+                    header += line
+                    continue
+                self.put(ship)
+                N += 1
+        self.recordFile(collection, fileName, header)
+        self.commit()
+        return N, ignored
+
+    # Import a collection from its sss file if the file has changed
+    # Returns False if the file does not exist and the collection has never
+    # been imported, otherwise True.
+    def sync(self, collection, fileName):
+        if not os.path.exists(fileName):
+            return self.db.execute('SELECT 1 FROM collections WHERE collection = ?',
+                                   (collection,)).fetchone() is not None
+        if not self.isCurrent(collection, fileName):
+            self.importSSS(collection, fileName)
+        return True
+
+    # Write a collection to an sss file
+    def exportSSS(self, collection, fileName):
+        with open(fileName, 'w') as fOut:
+            fOut.write(self.header(collection))
+            for ship in self.ships(collection):
+                fOut.write(', '.join(map(str, ship))+'\n')
+
+# Canonical form of a ship in sss format (see sss.canon5Sship)
+# The canonical form is looked up in the store's cache, and computed and
+# cached (for the ship and for the canonical ship itself) if it is not found.
+# The record of the ship's cycle (phases, see sss.analyseShip) is passed on to
+# sss.canon5Sship, so the ship is not run again. Returns the canonical ship
+# and its bounding box area.
+def canonShip(store, ship, phases=None):
+    minpop, rulestr, dx, dy, period, shiprle = ship
+    key = shipKey(ship)
+    cached = store.getCanon(key)
+    if cached:
+        rulestr, shiprle, bbox = cached
+        dy, dx = sss.minmaxofabs((dx, dy))
+        return (minpop, rulestr, dx, dy, period, shiprle), bbox
+    canon = sss.canon5Sship(ship, phases=phases)
+    bbox = bboxArea(canon[5])
+    store.putCanon(key, canon[1], canon[5], bbox)
+    store.putCanon(shipKey(canon), canon[1], canon[5], bbox)
+    return canon, bbox
+
+# Triage of candidate ships
+# Candidates in sss format claim a minimum population and speed, if the claim
+# can not be a new speed or an improvement on the collection (as given by
+# speedIndex, from ShipStore.speedIndex) then the candidate does not need to
+# be analysed. Returns True if the candidate (from sss.parseCandidates) needs
+# to be analysed, which is always the case for candidates in rle format
+# (without a claimed minpop).
+def needsTest(speedIndex, newship):
+    minpop, _, dx, dy, period, _ = newship
+    if not (minpop and period):
+        return True
+    dy, dx = sss.minmaxofabs((dx, dy))
+    if dx == 0:
+        # Oscillator
+        return False
+    knownpop = speedIndex.get((dx, dy, period))
+    return knownpop is None or minpop < knownpop
+
+# Update the collection store with analysed ships (from sss.analyseShip)
+# Each ship is classified once: a ship replaces the current ship of its speed
+# if its minimum population is reduced, and for a new speed the smallest ship
+# (by minpop, then bounding box area) is kept. Record ships are canonised and
+# put in the store, which is not committed. phases is an optional list with
+# the record of the cycle of each ship (or None, see canonShip).
+# progress(found, tested, N) is called every 100 ships. Returns dictionaries
+# (keyed by collection) of the new and updated speeds, sorted by period, then
+# decreasing dx, then decreasing dy.
+def updateStore(store, ships, progress=None, phases=None):
+    newSpeeds = dict((collection, set()) for collection in collectionNames)
+    updateSpeeds = dict((collection, set()) for collection in collectionNames)
+    N = 0 # New ship counter
+    NN = 0 # New ship (not oscillator) counter
+    found = 0
+    for newship in ships:
+        N += 1
+        if progress and N % 100 == 0:
+            progress(found, NN, N)
+        minpop, rulestr, dx, dy, period, shiprle = newship
+        dy, dx = sss.minmaxofabs((dx, dy))
+        collection = shipType(dx, dy)
+        if not collection: continue # oscillator
+        NN += 1
+        bUpdate = True
+        speed = (dx, dy, period)
+        currentpop = store.minpop(speed)
+        if currentpop is not None:
+            if minpop < currentpop:
+                if speed not in newSpeeds[collection]:
+                    if speed not in updateSpeeds[collection]:
+                        found += 1
+                    updateSpeeds[collection].add(speed)
+            elif minpop == currentpop:
+                # If the speed is not yet in the collection then make sure
+                # to update with the ship that has the smallest bounding box
+                # as well as the lowest minpop
+                if speed in newSpeeds[collection]:
+                    if store.bbox(speed) <= bboxArea(shiprle):
+                        bUpdate = False
+                else:
+                    bUpdate = False
+            else:
+                bUpdate = False
+        else:
+            # New speed
+            newSpeeds[collection].add(speed)
+            found += 1
+        if bUpdate:
+            # Canonise ship (cached in the store) and update collection
+            ship, bbox = canonShip(store, newship, phases[N-1] if phases else None)
+            store.put(ship, bbox)
+    order = lambda speed: (speed[2], -speed[0], -speed[1])
+    for collection in collectionNames:
+        newSpeeds[collection] = sorted(newSpeeds[collection], key=order)
+        updateSpeeds[collection] = sorted(updateSpeeds[collection], key=order)
+    return newSpeeds, updateSpeeds
+
+# Known speeds of a search
+# Mapping from speed to minimum population (like the foundSpeeds dictionary
+# used by the searches) combining the speeds found by the search (held in
+# local, which may be a shared dictionary) with the ships in a collection
+# store. Lookups return the smaller of the two, new speeds are only recorded
+# locally. len() counts the distinct speeds of both, but iteration (keys,
+# items) only covers the local speeds, so saving the known speeds with a
+# search checkpoint does not copy the collection.
+class KnownSpeeds(object):
+    def __init__(self, store, local=None):
+        self.store = store
+        self.local = {} if local is None else local
+
+    def get(self, speed, default=None):
+        minpop = self.local.get(speed)
+        storepop = self.store.minpop(speed)
+        if minpop is None or (storepop is not None and storepop < minpop):
+            minpop = storepop
+        return default if minpop is None else minpop
+
+    def __getitem__(self, speed):
+        minpop = self.get(speed)
+        if minpop is None:
+            raise KeyError(speed)
+        return minpop
+
+    def __setitem__(self, speed, minpop):
+        self.local[speed] = minpop
+
+    def __contains__(self, speed):
+        return self.get(speed) is not None
+
+    def __len__(self):
+        # The store holds one ship per speed
+        return len(self.store) + sum(1 for speed in self.local.keys()
+                                     if self.store.minpop(speed) is None)
+
+    def keys(self):
+        return self.local.keys()
+
+    def items(self):
+        return self.local.items()
+
+    # Record a speed locally if it is new or minpop is smaller than the known
+    # minimum population (see recordSpeed)
+    def record(self, speed, minpop):
+        storepop = self.store.minpop(speed)
+        if storepop is not None and storepop <= minpop:
+            return False
+        return recordSpeed(self.local, speed, minpop)
+
+speedsSchema = '''
+CREATE TABLE IF NOT EXISTS speeds (
+    dx INTEGER NOT NULL,
+    dy INTEGER NOT NULL,
+    period INTEGER NOT NULL,
+    minpop INTEGER NOT NULL,
+    PRIMARY KEY (dx, dy, period)
+) WITHOUT ROWID;
+'''
+
+# Known speeds shared by concurrent searches
+# Mapping from speed to minimum population (like the foundSpeeds dictionary)
+# in an SQLite database in WAL mode, which any number of search processes can
+# open. Reads do not wait for writers (they see the last committed state), and
+# record() is an atomic compare-and-set: a speed is only recorded if it is new
+# or its minimum population is smaller, so each new speed (or improvement) is
+# reported by one search only. Setting an item records it in the same way, the
+# recorded minimum population never increases.
+class SharedSpeeds(object):
+    def __init__(self, fileName=speedsFile):
+        self.fileName = fileName
+        # Autocommit, record() uses an explicit transaction
+        self.db = sqlite3.connect(fileName, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.executescript(speedsSchema)
+
+    def close(self):
+        self.db.close()
+
+    def get(self, speed, default=None):
+        row = self.db.execute('SELECT minpop FROM speeds WHERE dx = ? AND dy = ? AND period = ?',
+                              tuple(speed)).fetchone()
+        return row[0] if row else default
+
+    def __getitem__(self, speed):
+        minpop = self.get(speed)
+        if minpop is None:
+            raise KeyError(speed)
+        return minpop
+
+    def __setitem__(self, speed, minpop):
+        self.record(speed, minpop)
+
+    def __contains__(self, speed):
+        return self.get(speed) is not None
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM speeds').fetchone()[0]
+
+    def keys(self):
+        return [speed for speed, minpop in self.items()]
+
+    def items(self):
+        return [((dx, dy, period), minpop) for dx, dy, period, minpop in
+                self.db.execute('SELECT dx, dy, period, minpop FROM speeds')]
+
+    # Record a speed if it is new or minpop is smaller than the recorded
+    # minimum population. Returns True if the speed was recorded.
+    def record(self, speed, minpop):
+        dx, dy, period = speed
+        # Take the write lock before reading so the test and the update are
+        # atomic
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            N = self.db.execute('UPDATE speeds SET minpop = ? WHERE dx = ? AND dy = ? AND '
+                                'period = ? AND minpop > ?', (minpop, dx, dy, period, minpop)).rowcount
+            if not N:
+                N = self.db.execute('INSERT OR IGNORE INTO speeds VALUES (?, ?, ?, ?)',
+                                    (dx, dy, period, minpop)).rowcount
+            self.db.execute('COMMIT')
+        except:
+            self.db.execute('ROLLBACK')
+            raise
+        return N > 0
+
+# Record a speed in the known speeds of a search (a dictionary, KnownSpeeds or
+# SharedSpeeds) if it is new or minpop is smaller than the known minimum
+# population. Returns True if the speed was recorded.
+def recordSpeed(foundSpeeds, speed, minpop):
+    if hasattr(foundSpeeds, 'record'):
+        return foundSpeeds.record(speed, minpop)
+    if foundSpeeds.get(speed, minpop+1) <= minpop:
+        return False
+    foundSpeeds[speed] = minpop
+    return True
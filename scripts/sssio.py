@@ -0,0 +1,119 @@
+# sssio.py
+# Streaming reader and writer for files of ships in sss format
+# Search results files can have millions of lines, so ships are read lazily
+# (one line at a time, with a single compiled regex) and sorted output is
+# written with an external merge sort: the ships are sorted in chunks which
+# are spilled to temporary files and merged, so memory use is bounded whatever
+# the size of the input.
+#   import sssio
+#   for ship in sssio.readFile('results.txt'):
+#       ...  # (minpop, 'rulestr', dx, dy, period, 'shiprle')
+#   sssio.writeSorted('sorted.sss.txt', sssio.readFile('results.txt'))
+# Lines which are not ships (comments, headers, rle patterns, ...) are
+# skipped. The standard sort order of the 5S collections is by period, then
+# decreasing dx, then decreasing dy of the canonical speed (speedKey).
+
+import heapq
+import json
+import re
+import tempfile
+import sss
+
+# Ship in sss format, with optional spaces after the commas and the true
+# (possibly negative) displacement
+shipFormat = re.compile(r'\s*([1-9]\d*), *([^,\s]+), *(-?\d+), *(-?\d+), *(\d+), *([0-9A-Za-z.$]+!)')
+
+# Number of ships sorted in memory at a time
+defaultChunkSize = 100000
+
+# Ship in sss format from a line of text, or None if the line is not a ship
+def parseShip(line):
+    m = shipFormat.match(line)
+    if not m:
+        return None
+    minpop, rulestr, dx, dy, period, shiprle = m.groups()
+    return (int(minpop), rulestr, int(dx), int(dy), int(period), shiprle)
+
+# Ships in sss format from an iterable of lines
+def readShips(lines):
+    for line in lines:
+        ship = parseShip(line)
+        if ship:
+            yield ship
+
+# Ships in sss format from a file, the file is read one line at a time
+def readFile(fileName):
+    with open(fileName) as fIn:
+        for ship in readShips(fIn):
+            yield ship
+
+def formatShip(ship):
+    return ', '.join(map(str, ship))
+
+# Write ships to an open file, returns the number of ships written
+def writeShips(fOut, ships):
+    N = 0
+    for ship in ships:
+        fOut.write(formatShip(ship) + '\n')
+        N += 1
+    return N
+
+# Sort key of the 5S collections: period, then decreasing dx, then
+# decreasing dy of the canonical speed
+def speedKey(ship):
+    dy, dx = sss.minmaxofabs(ship[2:4])
+    return (ship[4], -dx, -dy)
+
+# Sorted run spilled to a temporary file, one JSON encoded (key, index, ship)
+# per line
+def writeRun(items, tmpDir=None):
+    f = tempfile.TemporaryFile(mode='w+', dir=tmpDir)
+    for item in items:
+        f.write(json.dumps(item) + '\n')
+    f.seek(0)
+    return f
+
+def readRun(f):
+    for line in f:
+        key, n, ship = json.loads(line)
+        yield (tuple(key), n, tuple(ship))
+
+# Sort ships by key with an external merge sort
+# A generator yielding the ships in sorted order, the sort is stable (ships
+# with the same key keep the input order). At most chunkSize ships (default:
+# defaultChunkSize) are held in memory, earlier chunks are sorted and spilled
+# to temporary files (in tmpDir, default: the system's temporary directory).
+# key must return a tuple of numbers and strings.
+def sortShips(ships, key=speedKey, chunkSize=None, tmpDir=None):
+    chunkSize = chunkSize or defaultChunkSize
+    runs = []
+    chunk = []
+    try:
+        for n, ship in enumerate(ships):
+            chunk.append((tuple(key(ship)), n, tuple(ship)))
+            if len(chunk) >= chunkSize:
+                chunk.sort()
+                runs.append(writeRun(chunk, tmpDir))
+                chunk = []
+        chunk.sort()
+        if not runs:
+            for _, _, ship in chunk:
+                yield ship
+            return
+        runs.append(writeRun(chunk, tmpDir))
+        chunk = []
+        for _, _, ship in heapq.merge(*[readRun(f) for f in runs]):
+            yield ship
+    finally:
+        for f in runs:
+            f.close()
+
+# Write ships to a file sorted by key (see sortShips), after the header text
+# The file is replaced atomically when it is complete. Returns the number of
+# ships written.
+def writeSorted(fileName, ships, header='', key=speedKey, chunkSize=None, tmpDir=None):
+    with open(fileName + '.tmp', 'w') as fOut:
+        fOut.write(header)
+        N = writeShips(fOut, sortShips(ships, key, chunkSize, tmpDir))
+    sss.replaceFile(fileName + '.tmp', fileName)
+    return N
@@ -0,0 +1,206 @@
+# sssjournal.py
+# Append-only journals of ships in sss format
+# Updating a collection by rewriting its sss file costs a full rewrite for
+# every update. Instead, new and improved ships are appended to the
+# collection's journal ('Orthogonal ships.sss.journal' for 'Orthogonal
+# ships.sss.txt'), and the journal is compacted into the sss file from time to
+# time: the best ship of each speed (minimum population, then bounding box
+# area) from the sss file and the journal is written in the standard order and
+# replaces the sss file atomically, then the journal is removed.
+#
+# Journals are written with buffered appends: records are buffered in memory
+# and written with a single append (O_APPEND) when bufferSize records are
+# buffered, after flushInterval seconds, or on flush() / close(), followed by
+# an fsync, so several processes can append to the same journal. Appending
+# holds a shared lock on the collection's lock file and compacting holds an
+# exclusive lock, so a collection can be fed by concurrent searches and
+# updaters while it is compacted (file locks are only available on POSIX
+# systems, elsewhere compaction must not run concurrently with updates).
+#   import sssjournal
+#   with sssjournal.collectionJournal('Orthogonal ships.sss.txt') as journal:
+#       journal.append(ship)
+#   sssjournal.compact('Orthogonal ships.sss.txt')
+# The collection store (sssdb.py) is brought up to date with the sss file and
+# its journal by syncCollection.
+#
+# Journals are also used for search results files, which are appended to by
+# the search scripts (without locking).
+
+import itertools
+import os
+import timeit
+import sssdb
+import sssio
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+timer = timeit.default_timer
+
+def journalName(sssFile):
+    return sssFile.rsplit('.txt', 1)[0] + '.journal'
+
+def lockName(sssFile):
+    return sssFile.rsplit('.txt', 1)[0] + '.lock'
+
+# Advisory lock on a lock file (shared or exclusive)
+class FileLock(object):
+    def __init__(self, fileName, bExclusive=False):
+        self.fileName = fileName
+        self.bExclusive = bExclusive
+
+    def __enter__(self):
+        self.f = open(self.fileName, 'a')
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX if self.bExclusive else fcntl.LOCK_SH)
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        self.f.close()
+
+class NullLock(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        pass
+
+class Journal(object):
+    # Number of buffered records which triggers a write
+    bufferSize = 100
+    # Maximum time records are buffered before they are written (seconds)
+    flushInterval = 5.0
+
+    def __init__(self, fileName, lockFile=None, bufferSize=None, flushInterval=None, bSync=True):
+        self.fileName = fileName
+        self.lockFile = lockFile
+        if bufferSize is not None:
+            self.bufferSize = bufferSize
+        if flushInterval is not None:
+            self.flushInterval = flushInterval
+        self.bSync = bSync
+        self.buffer = []
+        self.flushTime = timer()
+
+    # Append text (whole lines, e.g. comments), buffered
+    def write(self, text):
+        self.buffer.append(text)
+        if len(self.buffer) >= self.bufferSize or timer() - self.flushTime >= self.flushInterval:
+            self.flush()
+
+    # Append a ship in sss format, buffered
+    def append(self, ship):
+        self.write(sssio.formatShip(ship) + '\n')
+
+    # Write the buffered records with a single append and sync them to disk
+    # The journal is opened for each write, so it is recreated if it has been
+    # compacted since the last write.
+    def flush(self):
+        self.flushTime = timer()
+        if not self.buffer:
+            return
+        data = ''.join(self.buffer).encode()
+        lock = FileLock(self.lockFile) if self.lockFile else NullLock()
+        with lock:
+            fd = os.open(self.fileName, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                while data:
+                    data = data[os.write(fd, data):]
+                if self.bSync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.close()
+
+# Journal of a collection, given by its sss file
+def collectionJournal(sssFile, **kwargs):
+    return Journal(journalName(sssFile), lockName(sssFile), **kwargs)
+
+# Ships recorded in a collection's journal
+def readJournal(sssFile):
+    fileName = journalName(sssFile)
+    if not os.path.exists(fileName):
+        return iter(())
+    return sssio.readFile(fileName)
+
+def journalSize(sssFile):
+    return sum(1 for ship in readJournal(sssFile))
+
+# Order of the ships for the same speed, the best ship is the smallest
+def shipOrder(ship):
+    return (ship[0], sssdb.bboxArea(ship[5]))
+
+# Best ship of each speed from ships sorted by speed (sssio.speedKey), the
+# first ship is kept when ships are equally good
+def bestShips(ships):
+    for speed, group in itertools.groupby(ships, sssio.speedKey):
+        yield min(group, key=shipOrder)
+
+# Compact a collection's journal into its sss file
+# The sss file's header (all the lines which are not ships, found with the
+# same parser as the ships, sssio.parseShip) is kept. Returns the number of
+# ships in the compacted file, or None if there is no journal to compact.
+def compact(sssFile, tmpDir=None):
+    with FileLock(lockName(sssFile), bExclusive=True):
+        fileName = journalName(sssFile)
+        if not os.path.exists(fileName):
+            return None
+        header = ''
+        ships = sssio.readFile(fileName)
+        if os.path.exists(sssFile):
+            with open(sssFile) as fIn:
+                header = ''.join(line for line in fIn if not sssio.parseShip(line))
+            ships = itertools.chain(sssio.readFile(sssFile), ships)
+        N = sssio.writeSorted(sssFile, bestShips(sssio.sortShips(ships, tmpDir=tmpDir)), header)
+        os.remove(fileName)
+    return N
+
+# Apply a collection's journal to the collection store
+# Each ship in the journal (in canonical form) is recorded if it is a new
+# speed or better than the ship in the store. Returns the number of ships
+# recorded.
+def applyJournal(store, sssFile):
+    N = 0
+    for ship in readJournal(sssFile):
+        speed = ship[2:5]
+        current = store.get(speed)
+        if current is None or shipOrder(ship) < (current[0], store.bbox(speed)):
+            store.put(ship)
+            N += 1
+    store.commit()
+    return N
+
+# Record updated ships of a collection (from the collection store) in its
+# journal, and compact the journal into the sss file when it holds compactSize
+# ships, then bring the store up to date with ships recorded by other
+# updaters. Returns True if the journal was compacted. Raises IOError or
+# OSError if the journal or sss file can not be written.
+def recordShips(store, collection, sssFile, ships, compactSize):
+    with collectionJournal(sssFile) as journal:
+        for ship in ships:
+            journal.append(ship)
+    if journalSize(sssFile) < compactSize:
+        return False
+    compact(sssFile)
+    syncCollection(store, collection, sssFile)
+    return True
+
+# Bring a collection in the store up to date with its sss file (see
+# ShipStore.sync) and journal
+def syncCollection(store, collection, sssFile):
+    if not store.sync(collection, sssFile):
+        return False
+    applyJournal(store, sssFile)
+    return True
@@ -0,0 +1,183 @@
+# sssprof.py
+# Opt-in profiling of the sss routines and the search scripts
+# Counts and times named phases of the work (testShip, testRule's
+# stabilisation run and periodicity checks, findMinPop, setminisorule, file
+# writes, ...) and every call made to the Golly API (or the isosim backend)
+# through sss.getBackend(). Profiling is disabled by default, the phases then
+# only cost a test of the enabled flag and the backend is not wrapped.
+#   import sssprof
+#   sssprof.enable()  # wraps the current sss backend
+#   ... run a search ...
+#   sssprof.writeReport('profile.json', testStats=matchpatt.testStats)
+# Reports are written as JSON, or as CSV if the file name ends with '.csv'.
+#
+# Counters are kept per process as {name: [calls, seconds]}. Searches using
+# several processes collect the counters of each process (snapshot, or
+# Collector for multiprocessing pools) and merge them for the report.
+
+from __future__ import division
+
+import csv
+import functools
+import json
+import timeit
+
+timer = timeit.default_timer
+
+enabled = False
+counters = {}
+
+def add(name, seconds=0.0, calls=1):
+    counter = counters.get(name)
+    if counter is None:
+        counter = counters[name] = [0, 0.0]
+    counter[0] += calls
+    counter[1] += seconds
+
+# Count an event (without timing)
+def count(name, n=1):
+    if enabled:
+        add(name, 0.0, n)
+
+class Timer(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = timer()
+
+    def __exit__(self, excType, excValue, tb):
+        add(self.name, timer() - self.start)
+
+class NullTimer(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, excType, excValue, tb):
+        pass
+
+nullTimer = NullTimer()
+
+# Time a block of code as a named phase
+#   with sssprof.timed('testRule.stabilise'):
+#       g.run(stabGen)
+def timed(name):
+    return Timer(name) if enabled else nullTimer
+
+# Decorator timing every call of a function as a named phase
+def profiled(name):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add(name, timer() - start)
+        return wrapper
+    return decorate
+
+# Backend wrapper timing every call of the Golly API (as phases named 'g.*')
+class ProfiledBackend(object):
+    def __init__(self, backend):
+        self.backend = backend
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if not callable(attr):
+            return attr
+        key = 'g.' + name
+        def call(*args, **kwargs):
+            start = timer()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                add(key, timer() - start)
+        # Later calls find the wrapper without calling __getattr__
+        setattr(self, name, call)
+        return call
+
+# Enable profiling, wrapping the current sss backend
+def enable():
+    global enabled
+    import sss
+    if not isinstance(sss.getBackend(), ProfiledBackend):
+        sss.setBackend(ProfiledBackend(sss.getBackend()))
+    enabled = True
+
+def disable():
+    global enabled
+    import sss
+    backend = sss.getBackend()
+    if isinstance(backend, ProfiledBackend):
+        sss.setBackend(backend.backend)
+    enabled = False
+
+def reset():
+    counters.clear()
+
+# Copy of the counters (e.g. to send to another process)
+def snapshot():
+    return dict((name, list(counter)) for name, counter in counters.items())
+
+# Counters since the last call
+def takeCounters():
+    taken = snapshot()
+    reset()
+    return taken
+
+# Add the counters from another process to total
+def merge(total, other):
+    for name, (calls, seconds) in other.items():
+        counter = total.setdefault(name, [0, 0.0])
+        counter[0] += calls
+        counter[1] += seconds
+    return total
+
+# Callable for multiprocessing pools which runs func with profiling enabled
+# and returns its result along with the counters collected by the call
+class Collector(object):
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        enable()
+        result = self.func(*args, **kwargs)
+        return result, takeCounters()
+
+# Profile report
+# Phases are sorted by total time. testStats (see matchpatt.testStats) gives
+# the number of rules and generations for each outcome of the rule tests, and
+# info describes the run (script, parameters, ...).
+def report(profile=None, testStats=None, info=None):
+    if profile is None:
+        profile = counters
+    phases = [dict(name=name, calls=calls, seconds=seconds,
+                   perCall=seconds / calls if calls else 0.0)
+              for name, (calls, seconds) in profile.items()]
+    phases.sort(key=lambda phase: (-phase['seconds'], phase['name']))
+    rep = dict(info=info or {}, phases=phases)
+    if testStats:
+        rep['testStats'] = dict((stage, dict(rules=N, gens=gens))
+                                for stage, (N, gens) in testStats.items() if N)
+    return rep
+
+def writeReport(fileName, profile=None, testStats=None, info=None):
+    rep = report(profile, testStats, info)
+    if not fileName.lower().endswith('.csv'):
+        with open(fileName, 'w') as f:
+            json.dump(rep, f, indent=1, sort_keys=True)
+        return
+    with open(fileName, 'w') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['section', 'name', 'calls', 'seconds', 'gens'])
+        for key, value in sorted(rep['info'].items()):
+            writer.writerow(['info', key, '', '', value])
+        for phase in rep['phases']:
+            writer.writerow(['phase', phase['name'], phase['calls'], '%.6f' % phase['seconds'], ''])
+        for stage, stats in sorted(rep.get('testStats', {}).items()):
+            writer.writerow(['testStats', stage, stats['rules'], '', stats['gens']])
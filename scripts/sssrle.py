@@ -0,0 +1,188 @@
+# sssrle.py
+# RLE encoder and decoder for 2-state patterns, independent of Golly
+# Patterns are given as flat cell lists [x1, y1, x2, y2, ...] (as used by
+# g.getcells and g.putcells) or as NumPy arrays of (x, y) coordinates with
+# shape (N, 2). NumPy is optional, without it the pure Python code is used.
+#
+# encode() gives the same RLE as the original sss.giveRLE (the pattern
+# normalised to its bounding box, no header, no line breaks). Live cells are
+# grouped into runs over the coordinates sorted in reading order and the RLE
+# is built by joining the pieces for each run (run detection is vectorized
+# for coordinate arrays).
+#
+# decode() converts an RLE body to a cell list (like g.parse), decodeArray()
+# to a coordinate array. Decoder handles RLE bodies split over several lines
+# (or any other chunks) incrementally, readRLE() reads a complete RLE file
+# including the header line.
+#   import sssrle
+#   sssrle.encode([1, 0, 2, 1, 0, 2, 1, 2, 2, 2])  # 'bo$2bo$3o!'
+#   sssrle.decode('bo$2bo$3o!')  # [1, 0, 2, 1, 0, 2, 1, 2, 2, 2]
+#
+# Limitations:
+#   - Multistate RLE is decoded as a 2-state pattern, any live state is
+#     treated as state 1 (multi character states like 'pA' are not supported)
+
+import re
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Run count as written in RLE (omitted for runs of one cell)
+def count(n):
+    return str(n) if n > 1 else ''
+
+# Build RLE from runs of live cells (y, x, length) sorted in reading order
+# with x relative to the left edge of the bounding box
+def runsToRLE(runs):
+    pieces = []
+    lasty = runs[0][0]
+    nextx = 0
+    for y, x, n in runs:
+        if y != lasty:
+            pieces.append(count(y - lasty) + '$')
+            lasty = y
+            nextx = 0
+        if x > nextx:
+            pieces.append(count(x - nextx) + 'b')
+        pieces.append(count(n) + 'o')
+        nextx = x + n
+    pieces.append('!')
+    return ''.join(pieces)
+
+# Encode a cell list as RLE
+# Single pass over the sorted cells, writing the pieces for each run of live
+# cells when it ends.
+def encodeCells(clist):
+    xs = clist[0::2]
+    x0 = min(xs)
+    cells = sorted(zip(clist[1::2], xs))
+    pieces = []
+    lasty = cells[0][0]
+    nextx = start = x0
+    for y, x in cells:
+        if x == nextx and y == lasty:
+            nextx += 1
+            continue
+        if nextx > start:
+            pieces.append(count(nextx - start) + 'o')
+        if y != lasty:
+            pieces.append(count(y - lasty) + '$')
+            lasty = y
+            nextx = x0
+        if x > nextx:
+            pieces.append(count(x - nextx) + 'b')
+        start = x
+        nextx = x + 1
+    pieces.append(count(nextx - start) + 'o!')
+    return ''.join(pieces)
+
+# Runs of live cells in a coordinate array
+def arrayRuns(cells):
+    cells = np.asarray(cells).reshape(-1, 2)
+    if not len(cells):
+        return []
+    order = np.lexsort((cells[:, 0], cells[:, 1]))
+    xs = cells[order, 0] - cells[:, 0].min()
+    ys = cells[order, 1]
+    start = np.ones(len(cells), dtype=bool)
+    start[1:] = (ys[1:] != ys[:-1]) | (xs[1:] != xs[:-1] + 1)
+    idx = np.flatnonzero(start)
+    lengths = np.diff(np.append(idx, len(cells)))
+    return list(zip(ys[idx].tolist(), xs[idx].tolist(), lengths.tolist()))
+
+# Encode a pattern (cell list or coordinate array) as RLE
+# Returns '!' for an empty pattern.
+def encode(cells):
+    if np is not None and isinstance(cells, np.ndarray):
+        runs = arrayRuns(cells)
+        return runsToRLE(runs) if runs else '!'
+    if not len(cells):
+        return '!'
+    return encodeCells(cells)
+
+digitValue = dict((str(i), i) for i in range(10))
+
+# Incremental RLE decoder
+# feed() decodes a chunk of an RLE body and returns the cells of the chunk as
+# a flat cell list. The position and any partial run count are kept between
+# chunks, so an RLE body can be fed line by line. Decoding stops at '!' (done
+# is then set).
+class Decoder(object):
+    def __init__(self):
+        self.x = self.y = 0
+        self.count = 0
+        self.done = False
+
+    def feed(self, text):
+        clist = []
+        if self.done:
+            return clist
+        x, y, n = self.x, self.y, self.count
+        for ch in text:
+            if ch in digitValue:
+                n = 10*n + digitValue[ch]
+                continue
+            if ch == 'b' or ch == '.':
+                x += n or 1
+            elif ch == '$':
+                x = 0
+                y += n or 1
+            elif ch == '!':
+                self.done = True
+                break
+            elif ch.isalpha():
+                if n > 1:
+                    for x in range(x, x+n):
+                        clist += (x, y)
+                else:
+                    clist += (x, y)
+                x += 1
+            elif ch.isspace():
+                continue
+            n = 0
+        self.x, self.y, self.count = x, y, n
+        return clist
+
+# Decode an RLE body to a flat cell list
+def decode(rle):
+    return Decoder().feed(rle)
+
+# Decode an RLE body to an array of (x, y) coordinates
+def decodeArray(rle):
+    return np.array(decode(rle), dtype=np.int64).reshape(-1, 2)
+
+# Decode the cells of each line of an RLE file
+# A generator yielding a flat cell list for each line of the RLE body, the
+# header line and comment lines are skipped.
+rleHeader = re.compile(r'\s*x\s*=')
+def iterDecode(lines):
+    decoder = Decoder()
+    for line in lines:
+        line = line.strip()
+        if not line or line[0] == '#' or rleHeader.match(line):
+            continue
+        yield decoder.feed(line)
+        if decoder.done:
+            break
+
+# Read a pattern from the lines of an RLE file
+# Returns the cell list and the rule string from the header line (empty if
+# not given).
+def readRLE(lines):
+    rulestr = ''
+    clist = []
+    decoder = Decoder()
+    for line in lines:
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        if rleHeader.match(line):
+            parts = line.split('=')
+            if len(parts) == 4:
+                rulestr = parts[3].strip()
+            continue
+        clist.extend(decoder.feed(line))
+        if decoder.done:
+            break
+    return clist, rulestr